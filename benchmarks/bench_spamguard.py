@@ -0,0 +1,85 @@
+"""
+Benchmark: SpamDetector.observe() at 1,000 messages per second.
+
+Feeds a synthetic message stream (mostly normal chatter from a few hundred
+users, plus a handful of spammers) into the detector on the event loop at
+the target rate, the way on_message would, while loopmon.LoopMonitor measures
+loop lag. Also reports the raw per-message cost. Run from the repo root:
+
+    python benchmarks/bench_spamguard.py [--rate 1000] [--seconds 10]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spamguard import SpamDetector  # noqa: E402
+from loopmon import LoopMonitor  # noqa: E402
+
+TICK = 0.01  # deliver messages in 10 ms batches, like bursts of gateway events
+
+def make_stream(n: int, users: int = 5000, spammers: int = 5, channels: int = 200):
+    rng = random.Random(42)
+    words = ["hello", "anyone", "on", "duty", "ticket", "desk", "ia", "hr", "thanks", "ok", "patrol", "10-4"]
+    stream = []
+    for i in range(n):
+        if rng.random() < 0.05:
+            uid = rng.randint(1, spammers)  # spammers: same text, lots of mentions
+            stream.append((uid, rng.randint(1, 3), i, "JOIN MY SERVER discord.gg/xyz", 3))
+        else:
+            uid = spammers + rng.randint(1, users)
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+            stream.append((uid, rng.randint(1, channels), i, text, 1 if rng.random() < 0.05 else 0))
+    return stream
+
+def raw_cost(stream) -> float:
+    detector = SpamDetector()
+    t = 0.0
+    started = time.perf_counter()
+    for uid, cid, mid, text, mentions in stream:
+        t += 0.001
+        detector.observe(uid, cid, mid, text, mentions, now=t)
+    return (time.perf_counter() - started) / len(stream)
+
+async def run(rate: int, seconds: float):
+    stream = make_stream(int(rate * seconds))
+    detector = SpamDetector()
+    monitor = LoopMonitor(interval=0.005, threshold=0.05)
+    monitor.start()
+    await asyncio.sleep(0.2)  # baseline samples
+
+    per_tick = max(1, int(rate * TICK))
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    verdicts = 0
+    for i in range(0, len(stream), per_tick):
+        for uid, cid, mid, text, mentions in stream[i:i + per_tick]:
+            verdicts += len(detector.observe(uid, cid, mid, text, mentions))
+        # Hold the target rate
+        due = started + (i + per_tick) / rate
+        await asyncio.sleep(max(0.0, due - loop.time()))
+    elapsed = loop.time() - started
+    monitor.stop()
+
+    lag = monitor.percentiles()
+    stats = detector.stats()
+    print(f"{len(stream)} messages in {elapsed:.2f}s ({len(stream) / elapsed:.0f} msg/s)")
+    print(f"verdicts={verdicts}  user_trips={stats['user_trips']}  raid_trips={stats['raid_trips']}  active_users={stats['active_users']}")
+    print(f"loop lag p50={lag['p50_ms']} ms  p90={lag['p90_ms']} ms  p99={lag['p99_ms']} ms  max={lag['max_ms']} ms  stalls={lag['stalls']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    per_msg = raw_cost(make_stream(100_000))
+    print(f"observe(): {per_msg * 1e6:.2f} us/message (~{1 / per_msg:,.0f} msg/s on one core)")
+    asyncio.run(run(args.rate, args.seconds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: event-loop lag while rendering a 50k-message transcript.
+
+Runs the same render twice - inline on the event loop (the old behaviour) and
+through TranscriptRenderer's process pool - while a probe task measures how
+late the loop wakes it up. Run from the repo root:
+
+    python benchmarks/bench_transcripts.py [--messages 50000] [--format txt|jsonl|html]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcripts import TranscriptRenderer, render_transcript  # noqa: E402
+
+PROBE_INTERVAL = 0.005  # 5 ms
+
+def make_records(n: int) -> list[dict]:
+    rng = random.Random(1234)
+    words = ["ticket", "desk", "support", "please", "help", "officer", "report", "<b>html</b>", "ok", "thanks"]
+    start = time.time() - n
+    records = []
+    for i in range(n):
+        records.append({
+            "id": 1_000_000_000_000_000 + i,
+            "ts": start + i,
+            "author": f"user{rng.randint(1, 50)}",
+            "author_id": 400_000_000_000_000_000 + rng.randint(1, 50),
+            "content": " ".join(rng.choice(words) for _ in range(rng.randint(3, 40))),
+            "attachments": ["https://cdn.discordapp.com/attachments/1/2/file.png"] if i % 50 == 0 else [],
+        })
+    return records
+
+async def probe(samples: list[float], stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(max(0.0, loop.time() - expected))
+
+def pct(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def run_case(name: str, render, records: list[dict], fmt: str):
+    samples: list[float] = []
+    stop = asyncio.Event()
+    task = asyncio.create_task(probe(samples, stop))
+    await asyncio.sleep(0.05)  # let the probe settle
+    started = time.perf_counter()
+    data = await render(records, fmt)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await task
+    print(f"{name:<8} render={elapsed * 1000:8.1f} ms  size={len(data) / 1024:8.0f} KiB  "
+          f"lag p50={pct(samples, 0.50) * 1000:6.2f} ms  p99={pct(samples, 0.99) * 1000:7.2f} ms  "
+          f"max={max(samples, default=0.0) * 1000:7.2f} ms")
+
+async def main(n: int, fmt: str):
+    records = make_records(n)
+    print(f"{n} messages, format={fmt}")
+
+    async def inline(records, fmt):
+        return render_transcript(records, fmt)
+
+    renderer = TranscriptRenderer(max_workers=1)
+    # Warm the pool first so worker start-up isn't counted against the render.
+    await renderer.render(records[:10], fmt)
+    try:
+        await run_case("inline", inline, records, fmt)
+        await run_case("pool", renderer.render, records, fmt)
+    finally:
+        renderer.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--format", default="txt", choices=["txt", "jsonl", "html"])
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.format))
@@ -0,0 +1,148 @@
+"""
+Ticket category allocation - categories.py
+
+A Discord category holds at most 50 channels. When a ticket category is full,
+new tickets go to an overflow category named after it ("Desk Support 2",
+"Desk Support 3", ...) created with the same permission overwrites. Empty
+overflow categories are deleted again once their last ticket is gone.
+
+Counts come from the gateway cache plus what we are creating right now, so
+choosing a category never needs a REST call; only creating or deleting an
+overflow category does. Overflow categories are recognised by name, so
+nothing needs persisting across restarts.
+"""
+
+import re
+import asyncio
+
+import discord
+
+CATEGORY_CHANNEL_LIMIT = 50
+
+class CategoryAllocator:
+    def __init__(self, base_ids: list[int], limit: int = CATEGORY_CHANNEL_LIMIT, rest=None):
+        self.base_ids = list(base_ids)
+        self.limit = limit
+        self.rest = rest  # optional ratelimit.RestScheduler for the create/delete calls
+        self._pending: dict[int, int] = {}        # category id -> channels currently being created
+        self._created: dict[int, set[int]] = {}   # category id -> channel ids we created that the cache may not show yet
+        self._locks: dict[int, asyncio.Lock] = {} # base category id -> lock (one allocation/cleanup at a time)
+        self._deleting: set[int] = set()          # empty overflow categories being deleted; never allocated into
+
+    # --- Counting (cache only) ---
+    def count(self, category: discord.CategoryChannel, exclude: int | None = None) -> int:
+        if category.id in self._deleting:
+            return self.limit  # on its way out: treat as full
+        cached = {c.id for c in category.channels}
+        created = self._created.get(category.id)
+        if created:
+            created -= cached  # the gateway caught up; stop tracking those
+            cached |= created
+        cached.discard(exclude)
+        return len(cached) + self._pending.get(category.id, 0)
+
+    def _overflow_pattern(self, base: discord.CategoryChannel) -> re.Pattern:
+        return re.compile(rf"^{re.escape(base.name)} (\d+)$")
+
+    def family(self, base: discord.CategoryChannel) -> list[discord.CategoryChannel]:
+        """The base category followed by its overflow categories, in number order."""
+        pattern = self._overflow_pattern(base)
+        overflow = []
+        for cat in base.guild.categories:
+            if cat.id in self._deleting:
+                continue
+            m = pattern.match(cat.name)
+            if m:
+                overflow.append((int(m.group(1)), cat))
+        overflow.sort(key=lambda pair: pair[0])
+        return [base] + [cat for _, cat in overflow]
+
+    def base_of(self, category: discord.CategoryChannel) -> discord.CategoryChannel | None:
+        """If category is an overflow category of one of our ticket categories, return that base."""
+        for base_id in self.base_ids:
+            base = category.guild.get_channel(base_id)
+            if base is not None and self._overflow_pattern(base).match(category.name):
+                return base
+        return None
+
+    def _lock(self, base_id: int) -> asyncio.Lock:
+        lock = self._locks.get(base_id)
+        if lock is None:
+            lock = self._locks[base_id] = asyncio.Lock()
+        return lock
+
+    # --- Allocation ---
+    async def reserve(self, base: discord.CategoryChannel) -> discord.CategoryChannel:
+        """
+        Pick the category a new ticket channel should go in and hold a slot in it.
+        Follow up with confirm() once the channel exists, or cancel() if creating it failed.
+        """
+        async with self._lock(base.id):
+            family = self.family(base)
+            for cat in family:
+                if self.count(cat) < self.limit:
+                    break
+            else:
+                cat = await self._create_overflow(base, family)
+            self._pending[cat.id] = self._pending.get(cat.id, 0) + 1
+            return cat
+
+    def confirm(self, category: discord.CategoryChannel, channel: discord.abc.GuildChannel):
+        self._release_pending(category.id)
+        self._created.setdefault(category.id, set()).add(channel.id)
+
+    def cancel(self, category: discord.CategoryChannel):
+        self._release_pending(category.id)
+
+    def _release_pending(self, category_id: int):
+        left = self._pending.get(category_id, 0) - 1
+        if left > 0:
+            self._pending[category_id] = left
+        else:
+            self._pending.pop(category_id, None)
+
+    async def _create_overflow(self, base: discord.CategoryChannel, family: list) -> discord.CategoryChannel:
+        # Number past every overflow category, including one still being deleted, so names never repeat
+        pattern = self._overflow_pattern(base)
+        numbers = [int(m.group(1)) for m in (pattern.match(c.name) for c in base.guild.categories) if m]
+        number = max(numbers, default=1) + 1
+        print(f"Category {base.name} is full; creating overflow category {base.name} {number}")
+        coro = base.guild.create_category(
+            name=f"{base.name} {number}",
+            overwrites=base.overwrites,
+            position=family[-1].position + 1,
+            reason=f"{base.name} reached the {self.limit}-channel limit",
+        )
+        # Part of creating a ticket channel, so it gets the same priority
+        return await (self.rest.critical(coro) if self.rest else coro)
+
+    # --- Cleanup ---
+    async def release(self, category: discord.CategoryChannel | None, channel_id: int):
+        """A channel left this category; delete the category if it is an empty overflow category."""
+        if category is None:
+            return
+        created = self._created.get(category.id)
+        if created:
+            created.discard(channel_id)
+            if not created:
+                del self._created[category.id]
+        base = self.base_of(category)
+        if base is None:
+            return  # base categories are never removed
+        # Decide under the lock, delete outside it: reserve() takes the same lock for new
+        # tickets and must not wait for background budget.
+        async with self._lock(base.id):
+            if self.count(category, exclude=channel_id) > 0:
+                return
+            cached = {c.id for c in category.guild.categories}
+            self._deleting &= cached  # drop categories the gateway already removed
+            self._deleting.add(category.id)
+            self._pending.pop(category.id, None)
+        try:
+            coro = category.delete(reason="Overflow ticket category is empty")
+            await (self.rest.background(coro) if self.rest else coro)
+        except discord.NotFound:
+            pass
+        except Exception:
+            self._deleting.discard(category.id)  # still there; allocate into it again
+            raise
@@ -0,0 +1,258 @@
+"""
+Background jobs - jobs.py
+
+A small in-process job queue for slow, multi-step work (ticket closes, purges).
+Interaction handlers only submit a job and acknowledge the click; a fixed
+number of workers run the jobs so concurrent closes don't all fight for the
+same rate limits at once.
+
+Every job is a plain dict persisted to a JSON file (no DB required, same idea
+as the ticket metadata in channel.topic). Handlers mark finished steps with
+checkpoint(), so a job interrupted by a restart resumes after the last
+completed step instead of starting over.
+
+Job dict layout:
+    {
+        "id": "close-1700000000000-1",
+        "kind": "close_ticket",
+        "key": "close:1234",        # dedupe key, one active job per key
+        "payload": {...},           # submit() arguments, JSON-safe
+        "state": "queued" | "running" | "failed",
+        "done": ["transcript"],     # completed steps
+        "data": {...},              # values saved alongside checkpoints
+        "status": {...},            # where progress is reported (set by the caller)
+        "error": None,
+        "created_at": 1700000000.0,
+        "failed_at": None,          # set when state becomes "failed"
+    }
+Finished jobs are dropped from the file; failed ones after failed_ttl seconds.
+"""
+
+import os
+import json
+import time
+import asyncio
+import itertools
+
+class JobQueue:
+    def __init__(self, path: str = "jobs_state.json", concurrency: int = 2, failed_ttl: float = 24 * 3600):
+        self.path = path
+        self.concurrency = max(1, concurrency)
+        self.failed_ttl = failed_ttl
+        self._handlers = {}     # kind -> async fn(job, queue)
+        self._reporter = None   # async fn(job, text)
+        self._jobs: dict[str, dict] = {}
+        self._by_key: dict[str, str] = {}
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._ids = itertools.count(1)
+        # Loaded on first submit()/start(), not here: constructing a queue must not touch the file
+        # (transcript pool workers re-import main.py, which builds one at import time).
+        self._loaded = False
+
+    # --- Registration ---
+    def handler(self, kind: str):
+        """Decorator: register the coroutine that runs jobs of this kind."""
+        def decorator(fn):
+            self._handlers[kind] = fn
+            return fn
+        return decorator
+
+    def reporter(self, fn):
+        """Decorator: register the coroutine used to show progress (job, text)."""
+        self._reporter = fn
+        return fn
+
+    # --- Submitting ---
+    def active(self, key: str) -> dict | None:
+        job_id = self._by_key.get(key)
+        return self._jobs.get(job_id) if job_id else None
+
+    def submit(self, kind: str, key: str, payload: dict, resume_failed: bool = False) -> tuple[dict, bool]:
+        """
+        Queue a job. Returns (job, created). If a job with the same key is
+        already queued or running, that job is returned with created=False.
+
+        A failed job with the same key is retried from its last checkpoint
+        (with the new payload) only if resume_failed is set; otherwise it is
+        discarded and a fresh job is queued.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        self._ensure_loaded()
+        self._expire_failed()
+        existing = self.active(key)
+        if existing and existing["state"] in ("queued", "running"):
+            return existing, False
+
+        if existing and existing["kind"] == kind and resume_failed:
+            job = existing
+            job["payload"] = payload
+            job["state"] = "queued"
+            job["error"] = None
+            job["failed_at"] = None
+        else:
+            if existing:
+                self._forget(existing)
+            job = {
+                "id": f"{kind}-{int(time.time() * 1000)}-{next(self._ids)}",
+                "kind": kind,
+                "key": key,
+                "payload": payload,
+                "state": "queued",
+                "done": [],
+                "data": {},
+                "status": {},
+                "error": None,
+                "created_at": time.time(),
+                "failed_at": None,
+            }
+            self._jobs[job["id"]] = job
+            self._by_key[key] = job["id"]
+        self._save()
+        self._enqueue(job)
+        return job, True
+
+    def _enqueue(self, job: dict):
+        if self._queue is None:
+            # Not started yet; start() picks queued jobs up from self._jobs.
+            return
+        self._queue.put_nowait(job["id"])
+
+    # --- Helpers for handlers ---
+    def done(self, job: dict, step: str) -> bool:
+        return step in job["done"]
+
+    def checkpoint(self, job: dict, step: str, **data):
+        """Mark a step finished (and store any values it produced) before moving on."""
+        if step not in job["done"]:
+            job["done"].append(step)
+        job["data"].update(data)
+        self._save()
+
+    def update(self, job: dict, **fields):
+        job.update(fields)
+        self._save()
+
+    async def report(self, job: dict, text: str):
+        if self._reporter is None:
+            return
+        try:
+            await self._reporter(job, text)
+        except Exception as e:
+            print(f"Failed reporting progress for job {job['id']}:", e)
+
+    def depth(self) -> int:
+        return sum(1 for j in self._jobs.values() if j["state"] == "queued")
+
+    # --- Lifecycle ---
+    async def start(self):
+        """Re-queue unfinished jobs (including ones loaded from disk) and start the workers. Safe to call twice."""
+        if self._queue is not None:
+            return
+        self._ensure_loaded()
+        self._queue = asyncio.Queue()
+        for job in list(self._jobs.values()):
+            if job["state"] in ("queued", "running"):
+                # A "running" job was interrupted by a restart; resume it.
+                job["state"] = "queued"
+                self._queue.put_nowait(job["id"])
+        self._save()
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._queue = None
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job["state"] != "queued":
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict):
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            print(f"No handler for job {job['id']} ({job['kind']}); dropping it.")
+            self._finish(job)
+            return
+        job["state"] = "running"
+        self._save()
+        try:
+            await handler(job, self)
+        except asyncio.CancelledError as e:
+            if asyncio.current_task().cancelling():
+                # The worker itself is being cancelled (stop() or loop shutdown):
+                # leave the job as running so it resumes on the next start.
+                raise
+            # Something the handler awaited was cancelled; that's a failure of this job only.
+            await self._fail(job, str(e) or "cancelled")
+            return
+        except Exception as e:
+            await self._fail(job, str(e))
+            return
+        self._finish(job)
+
+    async def _fail(self, job: dict, error: str):
+        print(f"Job {job['id']} failed:", error)
+        job["state"] = "failed"
+        job["error"] = error
+        job["failed_at"] = time.time()
+        self._save()
+        await self.report(job, f"Failed: {error}")
+
+    def _finish(self, job: dict):
+        self._forget(job)
+        self._save()
+
+    def _forget(self, job: dict):
+        self._jobs.pop(job["id"], None)
+        if self._by_key.get(job["key"]) == job["id"]:
+            del self._by_key[job["key"]]
+
+    def _expire_failed(self):
+        """Drop failed jobs nobody retried within failed_ttl. Returns True if any were dropped."""
+        cutoff = time.time() - self.failed_ttl
+        expired = [j for j in self._jobs.values()
+                   if j["state"] == "failed" and (j.get("failed_at") or j["created_at"]) < cutoff]
+        for job in expired:
+            self._forget(job)
+        return bool(expired)
+
+    # --- Persistence ---
+    def _ensure_loaded(self):
+        # Load before anything can call _save(), which rewrites the whole file.
+        if not self._loaded:
+            self._loaded = True
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                jobs = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print("Failed reading job state, starting empty:", e)
+            return
+        for job in jobs:
+            self._jobs[job["id"]] = job
+            self._by_key[job["key"]] = job["id"]
+        if self._expire_failed():
+            self._save()
+
+    def _save(self):
+        # Write to a temp file and swap it in so a crash never leaves half a file behind.
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(list(self._jobs.values()), f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print("Failed writing job state:", e)
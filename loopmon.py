@@ -0,0 +1,157 @@
+"""
+Event-loop lag monitor - loopmon.py
+
+Two parts:
+- A short periodic timer on the event loop. Each tick records how late the
+  loop woke it up ("lag"); the recent values back the percentiles exposed on
+  the keep-alive server's /metrics page.
+- A watchdog thread. If the timer stops ticking for longer than the threshold
+  the loop is blocked, so the thread samples the loop thread's stack (via
+  sys._current_frames) until it recovers, then prints which of our handlers
+  was running, e.g. "main.py:close_button".
+
+enable_debug() turns on asyncio's own slow-callback warnings as well.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque, Counter
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, window: int = 3000, max_stack_samples: int = 20):
+        self.interval = interval              # timer period (seconds)
+        self.threshold = threshold            # lag that counts as "blocked" (seconds)
+        self.max_stack_samples = max_stack_samples
+        self._lags = deque(maxlen=window)     # recent lag values (seconds); 3000 * 0.1s = last 5 minutes
+        self._stalls = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        # Frames from files under this directory are "ours" and used to name the culprit.
+        self._root = os.path.dirname(os.path.abspath(__file__))
+
+    # --- Lifecycle ---
+    def start(self):
+        """Start the timer and watchdog. Call from inside the running loop; safe to call twice."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def enable_debug(self, slow_callback: float | None = None):
+        """asyncio debug mode: logs any callback/step that runs longer than slow_callback seconds."""
+        loop = self._loop or asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = slow_callback if slow_callback is not None else self.threshold
+        logging.getLogger("asyncio").setLevel(logging.WARNING)
+
+    # --- Timer (runs on the loop) ---
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._lags.append(max(0.0, loop.time() - expected))
+            self._last_beat = time.monotonic()
+
+    # --- Watchdog (runs in its own thread) ---
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            beat = self._last_beat
+            if time.monotonic() - beat - self.interval < self.threshold:
+                continue
+            # Loop is blocked: sample its stack until the timer ticks again.
+            samples = []
+            task_name = self._current_task_name()
+            while self._last_beat == beat and not self._stop.is_set():
+                if len(samples) < self.max_stack_samples:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    if frame is not None:
+                        samples.append(traceback.extract_stack(frame))
+                self._stop.wait(poll)
+            blocked = self._last_beat - beat - self.interval
+            self._stalls += 1
+            self._report(blocked, task_name, samples)
+
+    def _current_task_name(self) -> str | None:
+        try:
+            task = asyncio.current_task(self._loop)
+        except Exception:
+            return None
+        return task.get_name() if task is not None else None
+
+    def _is_ours(self, filename: str) -> bool:
+        path = os.path.abspath(filename)
+        return path.startswith(self._root) and "site-packages" not in path and path != os.path.abspath(__file__)
+
+    def _culprit_frames(self, stack: traceback.StackSummary) -> list:
+        # Skip module-level frames: main.py's <module> (bot.run) is at the bottom of every stack.
+        return [fs for fs in stack if fs.name != "<module>" and self._is_ours(fs.filename)]
+
+    def _culprit(self, stack: traceback.StackSummary) -> str:
+        # Name the handler by the innermost frame in the bot's entry file (e.g. main.py:close_button,
+        # or main.py:run_close_ticket under jobs.py's worker), plus the innermost frame of ours if deeper.
+        ours = self._culprit_frames(stack)
+        if not ours:
+            fs = stack[-1] if stack else None
+            return f"{os.path.basename(fs.filename)}:{fs.name}" if fs else "unknown"
+        main_file = os.path.abspath(getattr(sys.modules.get("__main__"), "__file__", "") or "")
+        in_main = [fs for fs in ours if os.path.abspath(fs.filename) == main_file]
+        top = in_main[-1] if in_main else ours[0]
+        handler = f"{os.path.basename(top.filename)}:{top.name}"
+        deepest = ours[-1]
+        if deepest is top:
+            return handler
+        return f"{handler} -> {os.path.basename(deepest.filename)}:{deepest.name}:{deepest.lineno}"
+
+    def _report(self, blocked: float, task_name: str | None, samples: list):
+        if not samples:
+            print(f"[loopmon] Event loop blocked for {blocked * 1000:.0f} ms (no stack captured)")
+            return
+        culprits = Counter(self._culprit(s) for s in samples)
+        top, hits = culprits.most_common(1)[0]
+        print(f"[loopmon] Event loop blocked for {blocked * 1000:.0f} ms in {top} "
+              f"({hits}/{len(samples)} samples, task={task_name or 'none'})")
+        # Show the most representative sample in full
+        for s in samples:
+            if self._culprit(s) == top:
+                print("".join(s.format()).rstrip())
+                break
+
+    # --- Metrics ---
+    def percentiles(self) -> dict:
+        lags = sorted(self._lags)
+        if not lags:
+            return {"samples": 0, "p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "stalls": self._stalls}
+
+        def pct(q):
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))] * 1000, 2)
+
+        return {
+            "samples": len(lags),
+            "p50_ms": pct(0.50),
+            "p90_ms": pct(0.90),
+            "p99_ms": pct(0.99),
+            "max_ms": round(lags[-1] * 1000, 2),
+            "stalls": self._stalls,
+        }
@@ -4,13 +4,21 @@ Python 3.10+
 
 Features (mapped to your spec):
 - /panel -> public embed with dropdown (Desk / IA / HR)
-- Dropdown creates ticket channels under configured category IDs
+- Dropdown creates ticket channels under configured category IDs, spilling into overflow
+  categories ("Desk Support 2", ...) when one reaches Discord's 50-channel limit
 - Ticket embed in the ticket channel with buttons (Claim / Unclaim / Close)
 - Claim state persisted in channel.topic (so it survives restarts)
 - /add and /remove moderators-only commands (with logs and pings on add/remove)
 - /ping command (ephemeral)
 - Logs posted to LOG_CHANNEL_ID (no pings except for explicit add/remove or ticket creation)
-- Transcript attached as purged_messages_{channel_id}.txt to logs on close
+- Transcript attached as purged_messages_{channel_id}.txt (or .jsonl/.html via TRANSCRIPT_FORMAT) to logs on close,
+  rendered in a process pool so large tickets don't block the event loop
+- Close and /purge run as background jobs (jobs.py): the click is acknowledged at once, progress is
+  shown by editing that message, double closes are refused, and unfinished jobs resume after a restart
+- Outgoing REST calls are prioritised against Discord's rate-limit headers (ratelimit.py): interaction responses and channel creation first,
+  then user-visible work (incl. ticket-meta topic writes), then log sends / card refreshes; queue stats at /metrics
+- Sliding-window spam/raid guard on every message (spamguard.py): auto timeout, bulk delete, one log summary
+- Event-loop lag watchdog (loopmon.py) with stack sampling of blocking handlers; lag percentiles at /metrics
 - All embed titles prepend the logo emoji "<:emoji_1:1401614346316021813> "
 - Color used: #313D61
 - Sanitizes channel names (lowercase, replace spaces with '-', remove disallowed chars)
@@ -18,7 +26,9 @@ Features (mapped to your spec):
 
 import os
 import re
+import io
 import json
+import copy
 import asyncio
 import os
 GUILD_ID = int(os.getenv("GUILD_ID"))  # The server ID where you want commands to update immediately
@@ -29,6 +39,13 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from transcripts import TranscriptRenderer, message_record, transcript_filename, default_workers, FORMATS
+from jobs import JobQueue
+from loopmon import LoopMonitor
+from categories import CategoryAllocator
+from ratelimit import RestScheduler, VISIBLE
+from spamguard import SpamDetector
+
 # -----------------------------
 # Environment variables you'll set in Render (names below must match)
 # -----------------------------
@@ -40,6 +57,14 @@ from discord.ext import commands
 # LOG_CHANNEL_ID      - channel ID (int) where logs and transcripts are posted
 # NOTIFY_ROLE_ID      - role ID (int) to ping when a ticket is created (this is the single-role ping you requested)
 # GUILD_ID            - optional: the guild ID (int) to register commands to a single guild (recommended)
+# TRANSCRIPT_FORMAT   - optional: txt (default), jsonl or html
+# TRANSCRIPT_WORKERS  - optional: number of processes used to render transcripts
+# JOB_CONCURRENCY     - optional: how many closes/purges run at the same time (default 2)
+# JOB_STATE_PATH      - optional: JSON file where unfinished jobs are kept across restarts
+# LOOP_LAG_THRESHOLD_MS - optional: event-loop lag (ms) that triggers stack sampling (default 250)
+# LOOP_DEBUG          - optional: set to 1 to enable asyncio debug mode / slow-callback warnings
+# SPAM_GUARD          - optional: set to 0 to turn off automatic spam/raid handling (default on)
+# SPAM_TIMEOUT_MINUTES - optional: timeout given to a user who trips the spam detector (default 10)
 # -----------------------------
 
 # Load env
@@ -52,12 +77,22 @@ LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "0"))
 NOTIFY_ROLE_ID = int(os.getenv("NOTIFY_ROLE_ID", "0"))
 GUILD_ID = os.getenv("GUILD_ID")
 GUILD_ID = int(GUILD_ID) if GUILD_ID else None
+TRANSCRIPT_FORMAT = os.getenv("TRANSCRIPT_FORMAT", "txt").lower()
+TRANSCRIPT_WORKERS = int(os.getenv("TRANSCRIPT_WORKERS", "0")) or default_workers()
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_STATE_PATH = os.getenv("JOB_STATE_PATH", "jobs_state.json")
+LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "0") == "1"
+SPAM_GUARD = os.getenv("SPAM_GUARD", "1") == "1"
+SPAM_TIMEOUT_MINUTES = int(os.getenv("SPAM_TIMEOUT_MINUTES", "10"))
 
 # Basic runtime checks
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN environment variable not set.")
 if MOD_ROLE_ID == 0 or DESK_CATEGORY_ID == 0 or IA_CATEGORY_ID == 0 or HR_CATEGORY_ID == 0 or LOG_CHANNEL_ID == 0:
     raise RuntimeError("One or more required IDs (MOD_ROLE_ID, DESK_CATEGORY_ID, IA_CATEGORY_ID, HR_CATEGORY_ID, LOG_CHANNEL_ID) are not set or zero.")
+if TRANSCRIPT_FORMAT not in FORMATS:
+    raise RuntimeError(f"TRANSCRIPT_FORMAT must be one of: {', '.join(FORMATS)}")
 
 # ---------- Bot setup ----------
 intents = discord.Intents.default()
@@ -65,7 +100,13 @@ intents.message_content = True
 intents.messages = True
 intents.guilds = True
 intents.members = True
-bot = commands.Bot(command_prefix="/", intents=intents)
+
+# Every outgoing REST call goes through this so interaction responses and channel creation go first
+# (rest.critical), then what users are watching (rest.visible), then logs/card refreshes (rest.background).
+# Its HTTP trace feeds it the requests discord.py sends and Discord's rate-limit headers.
+rest = RestScheduler()
+
+bot = commands.Bot(command_prefix="/", intents=intents, http_trace=rest.trace_config())
 # If you prefer, you can use bot = discord.Client + app_commands tree, but this is simpler.
 
 # Constants used in embeds/UI
@@ -77,6 +118,24 @@ ICON_4 = "<:icon4:1420478165754712148>"
 ICON_6 = "<:icon6:1420478130157785271>"
 EMBED_COLOR = discord.Color(int("313D61", 16))  # hex #313D61
 
+# Transcript pool workers are spawned and re-import this file, so nothing below may do I/O or start
+# anything when constructed; files, threads and tasks are only touched from on_ready / the main guard.
+
+# Transcript formatting runs in a process pool so big tickets don't block the event loop.
+transcript_renderer = TranscriptRenderer(max_workers=TRANSCRIPT_WORKERS)
+
+# Closes and purges run as background jobs; handlers are registered further down.
+job_queue = JobQueue(path=JOB_STATE_PATH, concurrency=JOB_CONCURRENCY)
+
+# Watches for a blocked event loop (the cause of "heartbeat blocked" warnings); percentiles at /metrics.
+loop_monitor = LoopMonitor(interval=0.1, threshold=LOOP_LAG_THRESHOLD_MS / 1000)
+
+# Sliding-window spam/raid detection on every message (see on_message_spam_guard)
+spam_detector = SpamDetector()
+
+# Spills tickets into overflow categories ("Desk Support 2", ...) when a category hits Discord's 50-channel cap.
+category_allocator = CategoryAllocator([DESK_CATEGORY_ID, IA_CATEGORY_ID, HR_CATEGORY_ID], rest=rest)
+
 # --- Helpers for ticket metadata stored in channel.topic ---
 # We'll store a JSON blob inside the channel.topic prefixed with "ticket_meta:" so it's easily parseable.
 def _read_topic_meta(topic: str | None) -> dict:
@@ -97,6 +156,39 @@ def _write_topic_meta(meta: dict) -> str:
     # Be mindful of the 1024 char topic limit.
     return f"ticket_meta:{json.dumps(meta, separators=(',', ':'))}"
 
+# channel.topic is the persistent copy of a ticket's meta, but topic writes are queued (and Discord only
+# allows 2 channel edits per 10 minutes), so the topic can lag behind. Reads go through this cache
+# (channel id -> meta) instead; the topic is only parsed on a miss, e.g. after a restart.
+_ticket_meta: dict[int, dict] = {}
+_topic_writes_pending: set[int] = set()
+
+def get_ticket_meta(channel: discord.abc.GuildChannel) -> dict:
+    """A copy of the ticket's current meta ({} if the channel is not a ticket)."""
+    meta = _ticket_meta.get(channel.id)
+    if meta is None:
+        meta = _read_topic_meta(channel.topic)
+        if meta:
+            _ticket_meta[channel.id] = meta
+    return copy.deepcopy(meta)
+
+async def set_ticket_meta(channel: discord.abc.GuildChannel, meta: dict):
+    """
+    Replace the ticket's meta. The cache is updated before the first await, so a
+    get_ticket_meta() -> check -> set_ticket_meta() sequence can't interleave with
+    another handler. The topic write is queued; writes already waiting are coalesced.
+    """
+    _ticket_meta[channel.id] = copy.deepcopy(meta)
+    if channel.id in _topic_writes_pending:
+        return  # the queued write sends whatever is cached when it runs
+    _topic_writes_pending.add(channel.id)
+    await rest.visible(_write_ticket_topic(channel), route=channel.id)
+
+async def _write_ticket_topic(channel: discord.abc.GuildChannel):
+    _topic_writes_pending.discard(channel.id)  # changes from here on need a new write
+    meta = _ticket_meta.get(channel.id)
+    if meta is not None:
+        await channel.edit(topic=_write_topic_meta(meta))
+
 def sanitize_channel_name(name: str) -> str:
     # Lowercase, replace spaces with '-', remove characters except alphanum, '-', '_'
     name = name.lower().replace(" ", "-")
@@ -107,10 +199,10 @@ def sanitize_channel_name(name: str) -> str:
 
 def make_ticket_id() -> str:
     # Timestamp-based ID. No DB required.
-    return datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    return discord.utils.utcnow().strftime("%Y%m%d%H%M%S")
 
 async def get_log_channel(bot: commands.Bot) -> discord.TextChannel:
-    return bot.get_channel(LOG_CHANNEL_ID) or await bot.fetch_channel(LOG_CHANNEL_ID)
+    return bot.get_channel(LOG_CHANNEL_ID) or await rest.visible(bot.fetch_channel(LOG_CHANNEL_ID))
 
 # -------------- Logging helper (centralized) --------------
 async def log_action(action: str, user: discord.abc.Snowflake | discord.User, channel: discord.abc.Snowflake | discord.TextChannel, details: str = ""):
@@ -127,12 +219,13 @@ async def log_action(action: str, user: discord.abc.Snowflake | discord.User, ch
     who = getattr(user, "display_name", str(user))
     channel_display = channel.mention if hasattr(channel, "mention") else f"<#{getattr(channel, 'id', str(channel))}>"
 
-    embed = discord.Embed(title=f"{LOGO_EMOJI} {action}", color=EMBED_COLOR, timestamp=datetime.utcnow())
+    embed = discord.Embed(title=f"{LOGO_EMOJI} {action}", color=EMBED_COLOR, timestamp=discord.utils.utcnow())
     embed.description = f"User: {who}\nChannel: {channel_display}"
     if details:
         embed.add_field(name="Details", value=details[:1024], inline=False)
     embed.set_footer(text="Ticket System")
-    await log_channel.send(embed=embed)
+    # Plain log embeds are the first thing dropped when the rate-limit budget runs low
+    await rest.background(log_channel.send(embed=embed), route=log_channel.id, droppable=True)
 
 # ---------- UI: persistent view class ----------
 # We will register this view at startup (bot.add_view) so interactions are handled after restarts.
@@ -149,30 +242,30 @@ class TicketButtons(ui.View):
     # --- Claim Button ---
     @ui.button(label="Claim", style=ButtonStyle.green, custom_id="ticket_claim_button")
     async def claim_button(self, interaction: Interaction, button: ui.Button):
-        await interaction.response.defer(ephemeral=True)
+        await rest.critical(interaction.response.defer(ephemeral=True))
         channel = interaction.channel
-        meta = _read_topic_meta(channel.topic)
+        meta = get_ticket_meta(channel)
 
         # Check if already claimed
         if meta.get("claimed_by"):
-            await interaction.followup.send("This ticket is already claimed.", ephemeral=True)
+            await rest.critical(interaction.followup.send("This ticket is already claimed.", ephemeral=True))
             return
 
         # Only moderators can claim
         if not any(r.id == MOD_ROLE_ID for r in interaction.user.roles):
-            await interaction.followup.send("You do not have permission to claim tickets.", ephemeral=True)
+            await rest.critical(interaction.followup.send("You do not have permission to claim tickets.", ephemeral=True))
             return
 
         # Update meta
         meta["claimed_by"] = interaction.user.id
         meta["claimed_by_name"] = interaction.user.display_name
-        await channel.edit(topic=_write_topic_meta(meta))
+        await set_ticket_meta(channel, meta)
 
         # Update the ticket embed
         try:
             msg_id = meta.get("ticket_message_id")
             if msg_id:
-                msg = await channel.fetch_message(int(msg_id))
+                msg = await rest.background(channel.fetch_message(int(msg_id)), route=channel.id)
                 if msg.embeds:
                     old_embed = msg.embeds[0]
                     opener_line = (old_embed.description.splitlines()[0] if old_embed.description else "")
@@ -191,7 +284,7 @@ class TicketButtons(ui.View):
                     new_embed.add_field(name="Open date", value=meta.get("opened_at", "Unknown"), inline=True)
                     new_embed.add_field(name="Ticket ID", value=meta.get("ticket_id", "Unknown"), inline=True)
 
-                    await msg.edit(embed=new_embed, view=TicketButtonsViewClaimed())
+                    await rest.background(msg.edit(embed=new_embed, view=TicketButtonsViewClaimed()), route=channel.id)
         except Exception as e:
             print("Error updating ticket embed on claim:", e)
 
@@ -200,37 +293,37 @@ class TicketButtons(ui.View):
             title=f"{LOGO_EMOJI} Ticket Claimed",
             description=f"{interaction.user.mention} has claimed this ticket.",
             color=EMBED_COLOR,
-            timestamp=datetime.utcnow()
+            timestamp=discord.utils.utcnow()
         )
-        await channel.send(embed=confirm_embed)
+        await rest.visible(channel.send(embed=confirm_embed), route=channel.id)
         await log_action("Ticket Claimed", interaction.user, channel, details=f"Type: {meta.get('type')}")
-        await interaction.followup.send("Ticket claimed successfully.", ephemeral=True)
+        await rest.critical(interaction.followup.send("Ticket claimed successfully.", ephemeral=True))
 
     # --- Unclaim Button ---
     @ui.button(label="Unclaim", style=ButtonStyle.grey, custom_id="ticket_unclaim_button")
     async def unclaim_button(self, interaction: Interaction, button: ui.Button):
-        await interaction.response.defer(ephemeral=True)
+        await rest.critical(interaction.response.defer(ephemeral=True))
         channel = interaction.channel
-        meta = _read_topic_meta(channel.topic)
+        meta = get_ticket_meta(channel)
 
         claimed_by = meta.get("claimed_by")
         if not claimed_by:
-            await interaction.followup.send("Ticket is not claimed.", ephemeral=True)
+            await rest.critical(interaction.followup.send("Ticket is not claimed.", ephemeral=True))
             return
         if int(claimed_by) != interaction.user.id:
-            await interaction.followup.send("You cannot unclaim this ticket (not the claimer).", ephemeral=True)
+            await rest.critical(interaction.followup.send("You cannot unclaim this ticket (not the claimer).", ephemeral=True))
             return
 
         # Update meta
         meta["claimed_by"] = None
         meta["claimed_by_name"] = None
-        await channel.edit(topic=_write_topic_meta(meta))
+        await set_ticket_meta(channel, meta)
 
         # Update embed back to unclaimed state
         try:
             msg_id = meta.get("ticket_message_id")
             if msg_id:
-                msg = await channel.fetch_message(int(msg_id))
+                msg = await rest.background(channel.fetch_message(int(msg_id)), route=channel.id)
                 if msg.embeds:
                     old_embed = msg.embeds[0]
                     opener_line = (old_embed.description.splitlines()[0] if old_embed.description else "")
@@ -248,64 +341,42 @@ class TicketButtons(ui.View):
                     new_embed.add_field(name="Open date", value=meta.get("opened_at", "Unknown"), inline=True)
                     new_embed.add_field(name="Ticket ID", value=meta.get("ticket_id", "Unknown"), inline=True)
 
-                    await msg.edit(embed=new_embed, view=TicketButtonsView())
+                    await rest.background(msg.edit(embed=new_embed, view=TicketButtonsView()), route=channel.id)
         except Exception as e:
             print("Error updating ticket embed on unclaim:", e)
 
         await log_action("Ticket Unclaimed", interaction.user, channel, details=f"Type: {meta.get('type')}")
-        await interaction.followup.send("Ticket unclaimed.", ephemeral=True)
+        await rest.critical(interaction.followup.send("Ticket unclaimed.", ephemeral=True))
 
     # --- Close Button ---
     @ui.button(label="Close", style=ButtonStyle.red, custom_id="ticket_close_button")
     async def close_button(self, interaction: Interaction, button: ui.Button):
-        await interaction.response.defer()  # visible to all
         channel = interaction.channel
-        meta = _read_topic_meta(channel.topic)
+        meta = get_ticket_meta(channel)
 
         # Only moderators
         if not any(r.id == MOD_ROLE_ID for r in interaction.user.roles):
-            try:
-                await interaction.followup.send("You do not have permission to close tickets.", ephemeral=True)
-            except:
-                pass
+            await rest.critical(interaction.response.send_message("You do not have permission to close tickets.", ephemeral=True))
             return
 
-        # Collect message history and compile transcript
-        transcript_buf = StringIO()
-        async for msg in channel.history(limit=None, oldest_first=True):
-            ts = msg.created_at.replace(tzinfo=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-            author = f"{msg.author} ({getattr(msg.author, 'id', 'unknown')})"
-            content = msg.content or ""
-            # Indicate attachments
-            if msg.attachments:
-                content += " [Attachments: " + ", ".join(a.url for a in msg.attachments) + "]"
-            transcript_buf.write(f"{ts} | {author}: {content}\n")
-
-        transcript_buf.seek(0)
-        file_name = f"purged_messages_{channel.id}.txt"
-        discord_file = discord.File(transcript_buf, filename=file_name)
-
-        # Send to logs channel with embed
-        log_channel = await get_log_channel(bot)
-        details = f"Type: {meta.get('type')}\nClosed by: {interaction.user.display_name}"
-        embed = discord.Embed(title=f"{LOGO_EMOJI} Ticket Closed", color=EMBED_COLOR, timestamp=datetime.utcnow())
-        embed.description = f"User: {interaction.user.display_name}\nChannel: {channel.mention}"
-        embed.add_field(name="Details", value=details, inline=False)
-        await log_channel.send(embed=embed, file=discord_file)
-
-        # Log action with helper (no ping)
-        await log_action("Ticket Closed", interaction.user, channel, details=f"Transcript attached: {file_name}")
+        # The transcript, logs and channel delete run in the job queue (see run_close_ticket)
+        job, created = job_queue.submit("close_ticket", key=f"close:{channel.id}", payload={
+            "channel_id": channel.id,
+            "type": meta.get("type"),
+            "closed_by": interaction.user.id,
+            "closed_by_name": interaction.user.display_name,
+        }, resume_failed=True)  # a failed close picks up where it stopped (the transcript isn't sent twice)
+        if not created:
+            await rest.critical(interaction.response.send_message("This ticket is already being closed.", ephemeral=True))
+            return
 
-        # Delete the ticket channel
+        track_job_interaction(job, interaction)
+        await rest.critical(interaction.response.send_message(f"{LOGO_EMOJI} Closing ticket (requested by {interaction.user.display_name})... queued."))  # visible to all
         try:
-            await channel.delete(reason=f"Ticket closed by {interaction.user}")
+            status_msg = await rest.visible(interaction.original_response(), route=channel.id)
+            job_queue.update(job, status={"channel_id": channel.id, "message_id": status_msg.id})
         except Exception as e:
-            print("Failed deleting channel:", e)
-            # If deletion fails, notify in-channel
-            try:
-                await interaction.followup.send("Ticket closed, but failed to delete channel.", ephemeral=True)
-            except:
-                pass
+            print("Failed fetching close status message:", e)
 
 # Additional view classes to swap buttons when claimed/unclaimed.
 class TicketButtonsViewClaimed(TicketButtonsView):
@@ -333,9 +404,9 @@ async def on_ready():
     # Optionally, sync commands to a specific guild for immediate availability
     try:
         if GUILD_ID:
-            await bot.tree.sync(guild=discord.Object(id=GUILD_ID))
+            await rest.background(bot.tree.sync(guild=discord.Object(id=GUILD_ID)))
         else:
-            await bot.tree.sync()
+            await rest.background(bot.tree.sync())
     except Exception as e:
         print("Error syncing commands:", e)
 
@@ -345,7 +416,7 @@ async def on_ready():
 @bot.tree.command(name="ping", description="Check bot latency (ephemeral)")
 async def ping(interaction: discord.Interaction):
     latency = round(bot.latency * 1000)
-    await interaction.response.send_message(f"Pong! {latency}ms", ephemeral=True)
+    await rest.critical(interaction.response.send_message(f"Pong! {latency}ms", ephemeral=True))
 
 # ---- /panel ----
 class TicketDropdown(discord.ui.Select):
@@ -358,7 +429,7 @@ class TicketDropdown(discord.ui.Select):
         super().__init__(placeholder="Select ticket type...", min_values=1, max_values=1, options=options, custom_id="ticket_dropdown")
 
     async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
+        await rest.critical(interaction.response.defer(ephemeral=True))
         ticket_type = self.values[0]
         user = interaction.user
         # Map to category IDs
@@ -369,10 +440,12 @@ class TicketDropdown(discord.ui.Select):
         }
         category_id = type_map.get(ticket_type)
         if not category_id:
-            await interaction.followup.send("Invalid ticket type selected.", ephemeral=True)
+            await rest.critical(interaction.followup.send("Invalid ticket type selected.", ephemeral=True))
             return
         guild = interaction.guild
-        category = guild.get_channel(category_id) or await guild.fetch_channel(category_id)
+        base_category = guild.get_channel(category_id) or await rest.critical(guild.fetch_channel(category_id))
+        # Picks the base category or an overflow one with room (cache only, no REST unless a new one is needed)
+        category = await category_allocator.reserve(base_category)
 
         # Create channel name sanitized
         raw_channel_name = f"{ticket_type}-{user.name}"
@@ -385,11 +458,16 @@ class TicketDropdown(discord.ui.Select):
             guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
         }
 
-        ticket_channel = await guild.create_text_channel(name=chan_name, category=category, overwrites=overwrites, reason=f"Ticket created by {user}")
+        try:
+            ticket_channel = await rest.critical(guild.create_text_channel(name=chan_name, category=category, overwrites=overwrites, reason=f"Ticket created by {user}"))
+        except Exception:
+            category_allocator.cancel(category)
+            raise
+        category_allocator.confirm(category, ticket_channel)
 
         # Prepare ticket metadata
         ticket_id = make_ticket_id()
-        opened_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+        opened_at = discord.utils.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
         meta = {
             "ticket_id": ticket_id,
             "type": ticket_type,
@@ -402,8 +480,11 @@ class TicketDropdown(discord.ui.Select):
             # ticket_message_id will be added after message is posted
         }
 
+        # Cache it now so a Claim clicked before the topic write lands sees the full meta
+        _ticket_meta[ticket_channel.id] = copy.deepcopy(meta)
+
         # Build initial embed in ticket channel (exact text per spec)
-        embed = discord.Embed(title=f"{LOGO_EMOJI} {ticket_type} Ticket", description=f"Ticket opened by {user.mention}\nClaimed by: None", color=EMBED_COLOR, timestamp=datetime.utcnow())
+        embed = discord.Embed(title=f"{LOGO_EMOJI} {ticket_type} Ticket", description=f"Ticket opened by {user.mention}\nClaimed by: None", color=EMBED_COLOR, timestamp=discord.utils.utcnow())
         embed.add_field(name="Claimed by", value="None", inline=False)
         embed.add_field(name="People added", value="None", inline=False)
         embed.add_field(name="Open date", value=opened_at, inline=True)
@@ -411,28 +492,30 @@ class TicketDropdown(discord.ui.Select):
 
         # Send embed with Claim + Close (the view has Claim + Close enabled)
         view = TicketButtonsView()
-        ticket_msg = await ticket_channel.send(embed=embed, view=view)
-
-        # Store message ID in meta and write to channel topic (persist)
-        meta["ticket_message_id"] = ticket_msg.id
-        await ticket_channel.edit(topic=_write_topic_meta(meta))
+        ticket_msg = await rest.visible(ticket_channel.send(embed=embed, view=view), route=ticket_channel.id)
 
         # Ephemeral reply to the opener with clickable channel mention (exact string format)
         # Also, per your rule, ping NOTIFY_ROLE_ID on creation (this is the only role ping for creation)
+        # Sent before the topic write so the opener isn't kept waiting on queued work.
         notify_role_mention = f"<@&{NOTIFY_ROLE_ID}>" if NOTIFY_ROLE_ID else ""
         reply_text = f"{user.mention}, your ticket has been created: {ticket_channel.mention}"
-        await interaction.followup.send(reply_text, ephemeral=True)
+        await rest.critical(interaction.followup.send(reply_text, ephemeral=True))
+
+        # Store message ID in meta and write to channel topic (persist)
+        meta = get_ticket_meta(ticket_channel)  # may already carry a claim
+        meta["ticket_message_id"] = ticket_msg.id
+        await set_ticket_meta(ticket_channel, meta)
 
         # Post a "Ticket Created" log to logs channel and, per spec, ping the notify role in that log message only
         log_channel = await get_log_channel(bot)
         details = f"Type: {ticket_type}\nOpened by: {user.display_name}\nTicket ID: {ticket_id}"
-        log_embed = discord.Embed(title=f"{LOGO_EMOJI} Ticket Created", description=f"User: {user.display_name}\nChannel: {ticket_channel.mention}", color=EMBED_COLOR, timestamp=datetime.utcnow())
+        log_embed = discord.Embed(title=f"{LOGO_EMOJI} Ticket Created", description=f"User: {user.display_name}\nChannel: {ticket_channel.mention}", color=EMBED_COLOR, timestamp=discord.utils.utcnow())
         log_embed.add_field(name="Details", value=details, inline=False)
         # send with role ping allowed
         if NOTIFY_ROLE_ID:
-            await log_channel.send(content=f"<@&{NOTIFY_ROLE_ID}>", embed=log_embed)
+            await rest.background(log_channel.send(content=f"<@&{NOTIFY_ROLE_ID}>", embed=log_embed), route=log_channel.id)
         else:
-            await log_channel.send(embed=log_embed)
+            await rest.background(log_channel.send(embed=log_embed), route=log_channel.id)
 
         # Central helper log (no ping)
         await log_action("Ticket Created", user, ticket_channel, details=f"Type: {ticket_type}")
@@ -446,9 +529,9 @@ async def panel(interaction: Interaction):
     try:
         # --- Check Moderator Role ---
         if not any(r.id == MOD_ROLE_ID for r in interaction.user.roles):
-            await interaction.response.send_message(
+            await rest.critical(interaction.response.send_message(
                 "You do not have permission to run this command.", ephemeral=True
-            )
+            ))
             return
 
         # --- Panel Embed ---
@@ -469,7 +552,7 @@ async def panel(interaction: Interaction):
             title=f"{LOGO_EMOJI} Assistance",
             description=panel_description,
             color=EMBED_COLOR,
-            timestamp=datetime.now(timezone.utc)
+            timestamp=discord.utils.utcnow()
         )
 
         # --- Persistent View ---
@@ -478,7 +561,7 @@ async def panel(interaction: Interaction):
         bot.add_view(view)                         # Make persistent across bot restarts
 
         # --- Send Panel Message ---
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=False)
+        await rest.critical(interaction.response.send_message(embed=embed, view=view, ephemeral=False))
 
         # --- Logging ---
         log_channel = await get_log_channel(bot)  # helper to fetch log channel
@@ -487,48 +570,70 @@ async def panel(interaction: Interaction):
                 title=f"{LOGO_EMOJI} Ticket Panel Posted",
                 description=f"Moderator: {interaction.user.mention}\nChannel: {interaction.channel.mention}",
                 color=EMBED_COLOR,
-                timestamp=datetime.now(timezone.utc)
+                timestamp=discord.utils.utcnow()
             )
-            await log_channel.send(embed=log_embed)
+            await rest.background(log_channel.send(embed=log_embed), route=log_channel.id, droppable=True)
 
     except Exception as e:
         print("Error in /panel command:", e)
         try:
-            await interaction.response.send_message(
+            await rest.critical(interaction.response.send_message(
                 "Failed to send panel. Check the logs.", ephemeral=True
-            )
+            ))
         except:
             pass
 
+# Commands that change something answer the interaction first (defer), since the change itself is
+# queued as rest.visible and may wait on the channel's budget past Discord's 3-second deadline.
+async def run_deferred_action(interaction: discord.Interaction, coro, route=None) -> bool:
+    """Run a deferred command's REST action; on failure report it in the followup and return False."""
+    try:
+        await rest.visible(coro, route=route)
+        return True
+    except discord.HTTPException as e:
+        await rest.critical(interaction.followup.send(f"Failed: {e.text or e}", ephemeral=True))
+        return False
+
 # ---- /add and /remove commands (mod-only) ----
 @bot.tree.command(name="add", description="Add a user to the current ticket channel (mods only)")
 @app_commands.describe(member="Member to add to ticket")
 async def add(interaction: discord.Interaction, member: discord.Member):
     # Command only usable in a ticket channel (we'll check topic metadata)
     if not any(r.id == MOD_ROLE_ID for r in interaction.user.roles):
-        await interaction.response.send_message("You do not have permission to use this command.", ephemeral=True)
+        await rest.critical(interaction.response.send_message("You do not have permission to use this command.", ephemeral=True))
         return
 
     channel = interaction.channel
-    meta = _read_topic_meta(channel.topic)
+    meta = get_ticket_meta(channel)
     if not meta:
-        await interaction.response.send_message("This command must be used inside a ticket channel.", ephemeral=True)
+        await rest.critical(interaction.response.send_message("This command must be used inside a ticket channel.", ephemeral=True))
         return
 
     # set permissions
-    await channel.set_permissions(member, view_channel=True, send_messages=True, read_message_history=True)
-    # update meta added list
+    await rest.critical(interaction.response.defer(ephemeral=True))
+    if not await run_deferred_action(interaction, channel.set_permissions(member, view_channel=True, send_messages=True, read_message_history=True), route=channel.id):
+        return
+
+    # Reply ephemeral to moderator and ping the added member in-channel per your rule
+    # (before the topic/card updates below, which are queued and may be delayed)
+    await rest.critical(interaction.followup.send(f"{member.mention} has been added to the ticket.", ephemeral=True))
+    # post a visible embed in ticket channel confirming add (everyone in ticket sees it)
+    confirm_embed = discord.Embed(title=f"{LOGO_EMOJI} User Added to Ticket", description=f"{member.mention} added to ticket by {interaction.user.mention}", color=EMBED_COLOR, timestamp=discord.utils.utcnow())
+    await rest.visible(channel.send(embed=confirm_embed), route=channel.id)
+
+    # update meta added list (re-read: other handlers may have changed it while we awaited)
+    meta = get_ticket_meta(channel)
     added = meta.get("added", [])
     if member.id not in added:
         added.append(member.id)
     meta["added"] = added
-    await channel.edit(topic=_write_topic_meta(meta))
+    await set_ticket_meta(channel, meta)
 
     # Update ticket embed to show People added field
     try:
         msg_id = meta.get("ticket_message_id")
         if msg_id:
-            msg = await channel.fetch_message(int(msg_id))
+            msg = await rest.background(channel.fetch_message(int(msg_id)), route=channel.id)
             if msg.embeds:
                 embed = msg.embeds[0]
                 opener_line = (embed.description.splitlines()[0] if embed.description else "")
@@ -540,16 +645,10 @@ async def add(interaction: discord.Interaction, member: discord.Member):
                 new_embed.add_field(name="People added", value=", ".join(f"<@{i}>" for i in people_added) if people_added else "None", inline=False)
                 new_embed.add_field(name="Open date", value=meta.get("opened_at", "Unknown"), inline=True)
                 new_embed.add_field(name="Ticket ID", value=meta.get("ticket_id", "Unknown"), inline=True)
-                await msg.edit(embed=new_embed)
+                await rest.background(msg.edit(embed=new_embed), route=channel.id)
     except Exception as e:
         print("Error updating ticket embed on add:", e)
 
-    # Reply ephemeral to moderator and ping the added member in-channel per your rule
-    await interaction.response.send_message(f"{member.mention} has been added to the ticket.", ephemeral=True)
-    # post a visible embed in ticket channel confirming add (everyone in ticket sees it)
-    confirm_embed = discord.Embed(title=f"{LOGO_EMOJI} User Added to Ticket", description=f"{member.mention} added to ticket by {interaction.user.mention}", color=EMBED_COLOR, timestamp=datetime.utcnow())
-    await channel.send(embed=confirm_embed)
-
     # Log (in logs, this one may mention the member as you allowed pings for add/remove)
     await log_action("User Added to Ticket", interaction.user, channel, details=f"Added {member.mention}")
 
@@ -557,29 +656,38 @@ async def add(interaction: discord.Interaction, member: discord.Member):
 @app_commands.describe(member="Member to remove from ticket")
 async def remove(interaction: discord.Interaction, member: discord.Member):
     if not any(r.id == MOD_ROLE_ID for r in interaction.user.roles):
-        await interaction.response.send_message("You do not have permission to use this command.", ephemeral=True)
+        await rest.critical(interaction.response.send_message("You do not have permission to use this command.", ephemeral=True))
         return
 
     channel = interaction.channel
-    meta = _read_topic_meta(channel.topic)
+    meta = get_ticket_meta(channel)
     if not meta:
-        await interaction.response.send_message("This command must be used inside a ticket channel.", ephemeral=True)
+        await rest.critical(interaction.response.send_message("This command must be used inside a ticket channel.", ephemeral=True))
         return
 
     # remove custom overwrite
-    await channel.set_permissions(member, overwrite=None)
-    # update meta added list
+    await rest.critical(interaction.response.defer(ephemeral=True))
+    if not await run_deferred_action(interaction, channel.set_permissions(member, overwrite=None), route=channel.id):
+        return
+
+    # Reply and confirm first; the topic/card updates below are queued
+    await rest.critical(interaction.followup.send(f"{member.mention} has been removed from the ticket.", ephemeral=True))
+    confirm_embed = discord.Embed(title=f"{LOGO_EMOJI} User Removed from Ticket", description=f"{member.mention} removed from ticket by {interaction.user.mention}", color=EMBED_COLOR, timestamp=discord.utils.utcnow())
+    await rest.visible(channel.send(embed=confirm_embed), route=channel.id)
+
+    # update meta added list (re-read: other handlers may have changed it while we awaited)
+    meta = get_ticket_meta(channel)
     added = meta.get("added", [])
     if member.id in added:
         added.remove(member.id)
     meta["added"] = added
-    await channel.edit(topic=_write_topic_meta(meta))
+    await set_ticket_meta(channel, meta)
 
     # Update embed
     try:
         msg_id = meta.get("ticket_message_id")
         if msg_id:
-            msg = await channel.fetch_message(int(msg_id))
+            msg = await rest.background(channel.fetch_message(int(msg_id)), route=channel.id)
             if msg.embeds:
                 embed = msg.embeds[0]
                 opener_line = (embed.description.splitlines()[0] if embed.description else "")
@@ -590,13 +698,10 @@ async def remove(interaction: discord.Interaction, member: discord.Member):
                 new_embed.add_field(name="People added", value=", ".join(f"<@{i}>" for i in people_added) if people_added else "None", inline=False)
                 new_embed.add_field(name="Open date", value=meta.get("opened_at", "Unknown"), inline=True)
                 new_embed.add_field(name="Ticket ID", value=meta.get("ticket_id", "Unknown"), inline=True)
-                await msg.edit(embed=new_embed)
+                await rest.background(msg.edit(embed=new_embed), route=channel.id)
     except Exception as e:
         print("Error updating ticket embed on remove:", e)
 
-    await interaction.response.send_message(f"{member.mention} has been removed from the ticket.", ephemeral=True)
-    confirm_embed = discord.Embed(title=f"{LOGO_EMOJI} User Removed from Ticket", description=f"{member.mention} removed from ticket by {interaction.user.mention}", color=EMBED_COLOR, timestamp=datetime.utcnow())
-    await channel.send(embed=confirm_embed)
     await log_action("User Removed from Ticket", interaction.user, channel, details=f"Removed {member.mention}")
 
 # ================================
@@ -609,7 +714,8 @@ import io
 import datetime
 
 # Utility to log mod actions
-async def log_action(interaction: discord.Interaction, action: str):
+# (named differently from the ticket log_action above, which it used to shadow)
+async def log_interaction(interaction: discord.Interaction, action: str):
     log_channel = interaction.guild.get_channel(int(LOG_CHANNEL_ID))
     if log_channel:
         embed = discord.Embed(
@@ -619,7 +725,7 @@ async def log_action(interaction: discord.Interaction, action: str):
             timestamp=datetime.datetime.utcnow()
         )
         embed.set_footer(text=f"By {interaction.user.display_name}")
-        await log_channel.send(embed=embed)
+        await rest.background(log_channel.send(embed=embed), route=log_channel.id, droppable=True)
 
 from datetime import datetime, timezone, timedelta
 
@@ -640,17 +746,19 @@ async def log_mod_action(interaction: discord.Interaction, title: str, descripti
             timestamp=datetime.datetime.utcnow()
         )
         embed.set_footer(text=f"By {interaction.user.display_name}")
-        await log_channel.send(embed=embed)
+        await rest.background(log_channel.send(embed=embed), route=log_channel.id, droppable=True)
 
 # --- /kick ---
 @bot.tree.command(name="kick", description="Kick a member (Mod only)")
 @app_commands.checks.has_role(int(MOD_ROLE_ID))
 @app_commands.describe(member="The member to kick", reason="Reason for the kick")
 async def kick(interaction: discord.Interaction, member: discord.Member, reason: str):
-    await member.kick(reason=reason)
+    await rest.critical(interaction.response.defer())
+    if not await run_deferred_action(interaction, member.kick(reason=reason)):
+        return
     description = f"{member.mention} was kicked.\nReason: {reason}"
     embed = discord.Embed(title="👢 Member Kicked", description=description, color=discord.Color.red(), timestamp=datetime.datetime.utcnow())
-    await interaction.response.send_message(embed=embed)
+    await rest.critical(interaction.followup.send(embed=embed))
     await log_mod_action(interaction, "Kick", description)
 
 # --- /ban ---
@@ -658,10 +766,12 @@ async def kick(interaction: discord.Interaction, member: discord.Member, reason:
 @app_commands.checks.has_role(int(MOD_ROLE_ID))
 @app_commands.describe(member="The member to ban", reason="Reason for the ban")
 async def ban(interaction: discord.Interaction, member: discord.Member, reason: str):
-    await member.ban(reason=reason)
+    await rest.critical(interaction.response.defer())
+    if not await run_deferred_action(interaction, member.ban(reason=reason)):
+        return
     description = f"{member.mention} was banned.\nReason: {reason}"
     embed = discord.Embed(title="🔨 Member Banned", description=description, color=discord.Color.red(), timestamp=datetime.datetime.utcnow())
-    await interaction.response.send_message(embed=embed)
+    await rest.critical(interaction.followup.send(embed=embed))
     await log_mod_action(interaction, "Ban", description)
 
 # --- /timeout ---
@@ -669,11 +779,13 @@ async def ban(interaction: discord.Interaction, member: discord.Member, reason:
 @app_commands.checks.has_role(int(MOD_ROLE_ID))
 @app_commands.describe(member="The member to timeout", duration="Duration in minutes", reason="Reason for the timeout")
 async def timeout(interaction: discord.Interaction, member: discord.Member, duration: int, reason: str):
-    until = datetime.datetime.utcnow() + datetime.timedelta(minutes=duration)
-    await member.timeout(until=until, reason=reason)
+    await rest.critical(interaction.response.defer())
+    until = discord.utils.utcnow() + datetime.timedelta(minutes=duration)
+    if not await run_deferred_action(interaction, member.timeout(until, reason=reason)):
+        return
     description = f"{member.mention} timed out for {duration} minutes.\nReason: {reason}"
     embed = discord.Embed(title="⏳ Member Timed Out", description=description, color=discord.Color.orange(), timestamp=datetime.datetime.utcnow())
-    await interaction.response.send_message(embed=embed)
+    await rest.critical(interaction.followup.send(embed=embed))
     await log_mod_action(interaction, "Timeout", description)
 
 # --- /lock ---
@@ -682,10 +794,12 @@ async def timeout(interaction: discord.Interaction, member: discord.Member, dura
 async def lock(interaction: discord.Interaction):
     overwrite = interaction.channel.overwrites_for(interaction.guild.default_role)
     overwrite.send_messages = False
-    await interaction.channel.set_permissions(interaction.guild.default_role, overwrite=overwrite)
+    await rest.critical(interaction.response.defer())
+    if not await run_deferred_action(interaction, interaction.channel.set_permissions(interaction.guild.default_role, overwrite=overwrite), route=interaction.channel.id):
+        return
     description = f"{interaction.channel.mention} has been locked."
     embed = discord.Embed(title="🔒 Channel Locked", description=description, color=discord.Color.dark_gray(), timestamp=datetime.datetime.utcnow())
-    await interaction.response.send_message(embed=embed)
+    await rest.critical(interaction.followup.send(embed=embed))
     await log_mod_action(interaction, "Lock", description)
 
 # --- /unlock ---
@@ -694,67 +808,248 @@ async def lock(interaction: discord.Interaction):
 async def unlock(interaction: discord.Interaction):
     overwrite = interaction.channel.overwrites_for(interaction.guild.default_role)
     overwrite.send_messages = True
-    await interaction.channel.set_permissions(interaction.guild.default_role, overwrite=overwrite)
+    await rest.critical(interaction.response.defer())
+    if not await run_deferred_action(interaction, interaction.channel.set_permissions(interaction.guild.default_role, overwrite=overwrite), route=interaction.channel.id):
+        return
     description = f"{interaction.channel.mention} has been unlocked."
     embed = discord.Embed(title="🔓 Channel Unlocked", description=description, color=discord.Color.green(), timestamp=datetime.datetime.utcnow())
-    await interaction.response.send_message(embed=embed)
+    await rest.critical(interaction.followup.send(embed=embed))
     await log_mod_action(interaction, "Unlock", description)
 
 # --- /purge ---
 @bot.tree.command(name="purge", description="Delete messages in bulk.")
 @app_commands.checks.has_role(int(MOD_ROLE_ID))
 async def purge(interaction: discord.Interaction, amount: int, reason: str):
-    import io
-    import datetime
-
     if amount < 1 or amount > 100:
-        await interaction.response.send_message("Amount must be between 1 and 100.", ephemeral=True)
+        await rest.critical(interaction.response.send_message("Amount must be between 1 and 100.", ephemeral=True))
         return
 
-    # Defer the response (acknowledge)
-    await interaction.response.defer(ephemeral=True)
+    # Fetch, delete and log run in the job queue (see run_purge)
+    job, created = job_queue.submit("purge", key=f"purge:{interaction.channel.id}", payload={
+        "channel_id": interaction.channel.id,
+        "amount": amount,
+        "reason": reason,
+        "moderator_mention": interaction.user.mention,
+    })
+    if not created:
+        await rest.critical(interaction.response.send_message("A purge is already running in this channel.", ephemeral=True))
+        return
+
+    track_job_interaction(job, interaction)
+    await rest.critical(interaction.response.send_message(f"Purge of {amount} messages queued.", ephemeral=True))
 
-    # Fetch messages asynchronously using modern async list comprehension
-    messages = [msg async for msg in interaction.channel.history(limit=amount, oldest_first=False)]
+# --- /say ---
+@bot.tree.command(name="say", description="Make the bot say something as an embed.")
+@app_commands.checks.has_role(int(MOD_ROLE_ID))
+async def say(interaction: discord.Interaction, text: str):
+    embed = discord.Embed(description=text, color=discord.Color.blue())
+    await rest.critical(interaction.response.defer(ephemeral=True))
+    if not await run_deferred_action(interaction, interaction.channel.send(embed=embed), route=interaction.channel.id):
+        return
+    await rest.critical(interaction.followup.send("Message sent.", ephemeral=True))
+    await log_interaction(interaction, f"**Say command used by {interaction.user}**\nContent: {text}")
 
-    # Create transcript text with proper UTC time format
-    transcript_text = "\n".join([
-        f"{m.created_at.strftime('%Y-%m-%d %H:%M:%S UTC')} | {m.author} ({m.author.id}): {m.content}"
-        for m in reversed(messages)  # chronological order
-    ])
+# ======================
+# BACKGROUND JOBS (close / purge)
+# ======================
 
-    # Prepare .txt file
-    transcript_file = discord.File(io.BytesIO(transcript_text.encode()), filename=f"purge_log_{interaction.channel.id}.txt")
+# Interactions that submitted a job, so progress can edit the original (possibly ephemeral) response.
+# Not persisted: after a restart, progress falls back to the status message saved on the job.
+_job_interactions: dict[str, discord.Interaction] = {}
+
+def track_job_interaction(job: dict, interaction: discord.Interaction):
+    # Failed jobs never pop their entry; drop any whose interaction token has expired.
+    for job_id in [j for j, i in _job_interactions.items() if i.is_expired()]:
+        del _job_interactions[job_id]
+    _job_interactions[job["id"]] = interaction
+
+@job_queue.reporter
+async def report_job_progress(job: dict, text: str):
+    interaction = _job_interactions.get(job["id"])
+    if interaction is not None and not interaction.is_expired():
+        await rest.visible(interaction.edit_original_response(content=text))
+        return
+    status = job.get("status") or {}
+    if status.get("message_id"):
+        msg = bot.get_partial_messageable(status["channel_id"]).get_partial_message(status["message_id"])
+        await rest.visible(msg.edit(content=text), route=status["channel_id"])
 
-    # Delete messages
-    await interaction.channel.delete_messages(messages)
+async def _job_channel(channel_id: int):
+    try:
+        return bot.get_channel(channel_id) or await rest.visible(bot.fetch_channel(channel_id))
+    except discord.NotFound:
+        return None
+
+@job_queue.handler("close_ticket")
+async def run_close_ticket(job: dict, queue: JobQueue):
+    p = job["payload"]
+    channel = await _job_channel(p["channel_id"])
+    if channel is None:
+        # Already deleted (by us before a restart, or by hand); nothing left to do.
+        _job_interactions.pop(job["id"], None)
+        return
 
-    # Send ephemeral confirmation
-    await interaction.followup.send(f"Purged {amount} messages. Reason: {reason}", ephemeral=True)
+    # Step 1: transcript to the log channel
+    if not queue.done(job, "transcript"):
+        await queue.report(job, f"{LOGO_EMOJI} Closing ticket... collecting messages.")
+        records = [message_record(msg) async for msg in rest.paced(channel.history(limit=None, oldest_first=True), route=channel.id)]
+        await queue.report(job, f"{LOGO_EMOJI} Closing ticket... rendering transcript ({len(records)} messages).")
+        data = await transcript_renderer.render(records, TRANSCRIPT_FORMAT, title=f"#{channel.name} transcript")
+        file_name = transcript_filename("purged_messages", channel.id, TRANSCRIPT_FORMAT)
 
-    # Log to the log channel
-    log_channel = interaction.guild.get_channel(int(LOG_CHANNEL_ID))
+        log_channel = await get_log_channel(bot)
+        details = f"Type: {p.get('type')}\nClosed by: {p['closed_by_name']}"
+        embed = discord.Embed(title=f"{LOGO_EMOJI} Ticket Closed", color=EMBED_COLOR, timestamp=discord.utils.utcnow())
+        embed.description = f"User: {p['closed_by_name']}\nChannel: {channel.mention}"
+        embed.add_field(name="Details", value=details, inline=False)
+        # Transcript upload: background, but never dropped
+        await rest.background(log_channel.send(embed=embed, file=discord.File(io.BytesIO(data), filename=file_name)), route=log_channel.id)
+        queue.checkpoint(job, "transcript", file_name=file_name)
+
+    # Step 2: log action with helper (no ping)
+    if not queue.done(job, "log"):
+        await log_action("Ticket Closed", p["closed_by_name"], channel, details=f"Transcript attached: {job['data'].get('file_name')}")
+        queue.checkpoint(job, "log")
+
+    # Step 3: delete the ticket channel. If this fails the job is marked failed and
+    # clicking Close again resumes here instead of re-sending the transcript.
+    await queue.report(job, f"{LOGO_EMOJI} Closing ticket... deleting channel.")
+    await rest.visible(channel.delete(reason=f"Ticket closed by {p['closed_by_name']}"), route=channel.id)
+    queue.checkpoint(job, "delete")
+    _job_interactions.pop(job["id"], None)
+
+@job_queue.handler("purge")
+async def run_purge(job: dict, queue: JobQueue):
+    p = job["payload"]
+    channel = await _job_channel(p["channel_id"])
+    if channel is None:
+        _job_interactions.pop(job["id"], None)
+        return
+
+    # Step 1: snapshot the messages (ids + transcript records) before anything is deleted
+    if not queue.done(job, "collect"):
+        await queue.report(job, f"Purging... collecting {p['amount']} messages.")
+        messages = [msg async for msg in rest.paced(channel.history(limit=p["amount"], oldest_first=False), VISIBLE, route=channel.id)]
+        records = [message_record(m) for m in reversed(messages)]  # chronological order
+        queue.checkpoint(job, "collect", records=records)
+
+    records = job["data"]["records"]
+
+    # Step 2: delete messages
+    if not queue.done(job, "delete"):
+        await queue.report(job, f"Purging... deleting {len(records)} messages.")
+        await rest.visible(channel.delete_messages([discord.Object(id=r["id"]) for r in records]), route=channel.id)
+        queue.checkpoint(job, "delete")
+
+    # Step 3: log to the log channel with the transcript (rendered in the process pool)
+    if not queue.done(job, "log"):
+        data = await transcript_renderer.render(records, TRANSCRIPT_FORMAT, title=f"#{channel.name} purge log")
+        transcript_file = discord.File(io.BytesIO(data), filename=transcript_filename("purge_log", channel.id, TRANSCRIPT_FORMAT))
+        log_channel = await get_log_channel(bot)
+        if log_channel:
+            embed = discord.Embed(
+                title="🔧 Moderation Action: Purge",
+                description=f"Channel: {channel.mention}\nModerator: {p['moderator_mention']}\nReason: {p['reason']}",
+                color=discord.Color.dark_red(),
+                timestamp=discord.utils.utcnow()
+            )
+            embed.set_footer(text="Ticket System / Mod Action")
+            await rest.background(log_channel.send(embed=embed, file=transcript_file), route=log_channel.id)
+        queue.checkpoint(job, "log")
+
+    await queue.report(job, f"Purged {len(records)} messages. Reason: {p['reason']}")
+    _job_interactions.pop(job["id"], None)
+
+# Any ticket channel going away (closed or deleted by hand) may leave an overflow category empty
+@bot.listen("on_guild_channel_delete")
+async def release_ticket_category(channel: discord.abc.GuildChannel):
+    if isinstance(channel, discord.CategoryChannel):
+        return
+    _ticket_meta.pop(channel.id, None)
+    try:
+        await category_allocator.release(channel.category, channel.id)
+    except Exception as e:
+        print("Failed cleaning up overflow category:", e)
+
+# ======================
+# SPAM / RAID GUARD
+# ======================
+
+_spam_tasks: set[asyncio.Task] = set()
+
+@bot.listen("on_message")
+async def on_message_spam_guard(message: discord.Message):
+    # Cheap, synchronous check on the loop; any actions run in their own task.
+    if not SPAM_GUARD or message.guild is None or message.author.bot:
+        return
+    if any(r.id == MOD_ROLE_ID for r in getattr(message.author, "roles", ())):
+        return
+    mentions = len(message.raw_mentions) + len(message.raw_role_mentions) + (1 if message.mention_everyone else 0)
+    for verdict in spam_detector.observe(message.author.id, message.channel.id, message.id, message.content, mentions):
+        if verdict["kind"] == "user":
+            task = asyncio.create_task(handle_spammer(message.guild, message.author, verdict))
+        else:
+            task = asyncio.create_task(report_raid(message.channel, verdict))
+        # Keep a reference until it finishes so the task isn't garbage-collected mid-way
+        _spam_tasks.add(task)
+        task.add_done_callback(_spam_tasks.discard)
+
+async def handle_spammer(guild: discord.Guild, member: discord.Member, verdict: dict):
+    reason = f"Spam guard: {verdict['reason']}"
+    timed_out = True
+    try:
+        await rest.visible(member.timeout(timedelta(minutes=SPAM_TIMEOUT_MINUTES), reason=reason))
+    except Exception as e:
+        timed_out = False
+        print(f"Spam guard failed to time out {member}:", e)
+
+    # Bulk-delete their recent messages, one call per channel
+    by_channel: dict[int, list[int]] = {}
+    for channel_id, message_id in verdict["messages"]:
+        by_channel.setdefault(channel_id, []).append(message_id)
+    deleted = 0
+    for channel_id, message_ids in by_channel.items():
+        channel = guild.get_channel_or_thread(channel_id)  # spam in threads/forum posts too
+        if channel is None:
+            continue
+        try:
+            for i in range(0, len(message_ids), 100):
+                chunk = [discord.Object(id=m) for m in message_ids[i:i + 100]]
+                await rest.visible(channel.delete_messages(chunk, reason=reason), route=channel_id)
+                deleted += len(chunk)
+        except Exception as e:
+            print(f"Spam guard failed deleting messages in {channel_id}:", e)
+
+    # One summary in the log channel (never dropped)
+    log_channel = await get_log_channel(bot)
     if log_channel:
+        channels = ", ".join(f"<#{c}>" for c in by_channel) or "None"
         embed = discord.Embed(
-            title="🔧 Moderation Action: Purge",
-            description=f"Channel: {interaction.channel.mention}\nModerator: {interaction.user.mention}\nReason: {reason}",
+            title="🔧 Spam Guard: User Timed Out" if timed_out else "🔧 Spam Guard: Spam Detected",
+            description=f"User: {member.mention} ({member.id})\nReason: {verdict['reason']}\nChannels: {channels}",
             color=discord.Color.dark_red(),
-            timestamp=datetime.datetime.utcnow()
+            timestamp=discord.utils.utcnow()
         )
-        embed.set_footer(text="Ticket System / Mod Action")
-        await log_channel.send(embed=embed, file=transcript_file)
+        embed.add_field(name="Timeout", value=f"{SPAM_TIMEOUT_MINUTES} minutes" if timed_out else "Failed", inline=True)
+        embed.add_field(name="Messages deleted", value=str(deleted), inline=True)
+        embed.set_footer(text="Ticket System / Auto Mod")
+        await rest.background(log_channel.send(embed=embed), route=log_channel.id)
 
-# --- /say ---
-@bot.tree.command(name="say", description="Make the bot say something as an embed.")
-@app_commands.checks.has_role(int(MOD_ROLE_ID))
-async def say(interaction: discord.Interaction, text: str):
-    embed = discord.Embed(description=text, color=discord.Color.blue())
-    await interaction.channel.send(embed=embed)
-    await interaction.response.send_message("Message sent.", ephemeral=True)
-    await log_action(interaction, f"**Say command used by {interaction.user}**\nContent: {text}")
+async def report_raid(channel: discord.abc.GuildChannel, verdict: dict):
+    # Many users at once: flag it for moderators (individual spammers are still handled above)
+    log_channel = await get_log_channel(bot)
+    if log_channel:
+        embed = discord.Embed(
+            title="🔧 Spam Guard: Possible Raid",
+            description=f"Channel: {channel.mention}\nActivity: {verdict['reason']}\nConsider /lock.",
+            color=discord.Color.dark_red(),
+            timestamp=discord.utils.utcnow()
+        )
+        embed.set_footer(text="Ticket System / Auto Mod")
+        await rest.background(log_channel.send(embed=embed), route=log_channel.id)
 
 # --- Flask keep-alive for UptimeRobot ---
-from flask import Flask
+from flask import Flask, jsonify
 import threading
 
 app = Flask("")
@@ -763,8 +1058,15 @@ app = Flask("")
 def home():
     return "Bot is alive!"
 
-# Start Flask server in a background thread
-threading.Thread(target=lambda: app.run(host="0.0.0.0", port=8080)).start()
+@app.route("/metrics")
+def metrics():
+    return jsonify({
+        "loop_lag": loop_monitor.percentiles(),
+        "jobs_queued": job_queue.depth(),
+        "rest": rest.metrics(),
+        "spam_guard": spam_detector.stats(),
+        "gateway_latency_ms": round(bot.latency * 1000, 2) if bot.latency == bot.latency else None,  # NaN before connect
+    })
 
 # --- ON_READY EVENT (combined) ---
 @bot.event
@@ -776,12 +1078,20 @@ async def on_ready():
     # Set bot presence
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name="for slash commands | Created by RE3"))
 
+    # Start the event-loop lag watchdog
+    loop_monitor.start()
+    if LOOP_DEBUG:
+        loop_monitor.enable_debug()
+
+    # Start background job workers (resumes closes/purges interrupted by a restart)
+    await job_queue.start()
+
     # Sync commands to guild
     try:
         if GUILD_ID:
-            await bot.tree.sync(guild=discord.Object(id=GUILD_ID))
+            await rest.background(bot.tree.sync(guild=discord.Object(id=GUILD_ID)))
         else:
-            await bot.tree.sync()
+            await rest.background(bot.tree.sync())
         print("✅ Slash commands synced to guild!")
     except Exception as e:
         print("❌ Failed to sync slash commands:", e)
@@ -790,4 +1100,10 @@ async def on_ready():
 
 # Run bot
 if __name__ == "__main__":
-    bot.run(BOT_TOKEN)
+    # Start Flask server in a background thread.
+    # Kept under the main guard: transcript pool workers are spawned and re-import this file.
+    threading.Thread(target=lambda: app.run(host="0.0.0.0", port=8080)).start()
+    try:
+        bot.run(BOT_TOKEN)
+    finally:
+        transcript_renderer.shutdown()
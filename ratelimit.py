@@ -0,0 +1,356 @@
+"""
+Outgoing REST scheduling - ratelimit.py
+
+Every REST call main.py makes goes through a RestScheduler with one of three
+priority classes:
+
+- CRITICAL    interaction responses/followups and ticket channel creation.
+              Never queued; they run at once (Discord gives us 3 seconds).
+- VISIBLE     things a user is looking at: confirmations in the channel,
+              permission changes, deletes, progress edits, and topic writes
+              (the topic holds ticket state such as the claim).
+- BACKGROUND  log-channel sends, transcript uploads, ticket-card refreshes.
+              Only run while the budget has headroom.
+
+discord.py still does the real rate-limit handling (it waits on 429s); this
+layer only decides what goes first, based on Discord's own numbers. The
+scheduler's trace_config() is installed as the bot's http_trace, so it sees
+every request discord.py sends (including ones we don't schedule, such as
+history pages) and the X-RateLimit-* headers of every response:
+
+- global budget  requests actually sent in the last second against Discord's
+                 ~50/s per bot, and a hard stop while a global 429 lasts
+- route budget   per bucket (X-RateLimit-Bucket) and major parameter (the
+                 channel/guild id in the URL): remaining and reset-after
+
+A queued call is matched to its bucket by what it is (the coroutine's
+qualname, e.g. "Messageable.send") and its route key (usually a channel id);
+the bucket for a kind of call is learned from the first response it gets.
+Until Discord has told us anything about a bucket, nothing waits on it.
+
+Background calls marked droppable (plain log embeds) are shed when the
+background queue is too deep or they have waited too long; the caller gets
+None back. Everything else is only ever delayed.
+"""
+
+import re
+import math
+import time
+import asyncio
+import contextvars
+from collections import deque
+
+import aiohttp
+
+CRITICAL = 0
+VISIBLE = 1
+BACKGROUND = 2
+CLASS_NAMES = {CRITICAL: "critical", VISIBLE: "visible", BACKGROUND: "background"}
+
+# After a bucket's reset passes we assume a fresh window of this length until a response says otherwise.
+PROVISIONAL_WINDOW = 1.0
+
+# The scheduled item whose coroutine runs in the current task, so the HTTP trace knows which call a response belongs to.
+_current_item: contextvars.ContextVar = contextvars.ContextVar("rest_item", default=None)
+
+_MAJOR_PARAMETER = re.compile(r"/(?:channels|guilds|webhooks)/(\d+)")
+
+class _Limit:
+    """What Discord last told us about one bucket for one major parameter."""
+    __slots__ = ("limit", "remaining", "reset_at")
+
+    def __init__(self, limit: int, remaining: int, reset_at: float):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_at = reset_at
+
+    def wait(self, need: int, now: float) -> float:
+        if now >= self.reset_at or self.remaining >= min(need, self.limit):
+            return 0.0
+        return self.reset_at - now
+
+    def take(self, now: float):
+        # Count a call we are about to send; the response overwrites this with the real value.
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + PROVISIONAL_WINDOW
+        self.remaining = max(0, self.remaining - 1)
+
+class _Item:
+    __slots__ = ("coro", "kind", "priority", "route", "droppable", "future", "enqueued", "precounted")
+
+    def __init__(self, coro, priority, route, droppable, future):
+        self.coro = coro
+        self.kind = getattr(coro, "__qualname__", None)
+        self.priority = priority
+        self.route = route
+        self.droppable = droppable
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.precounted = False  # counted against the global budget when started, before its request went out
+
+class _ClassStats:
+    def __init__(self):
+        self.submitted = 0
+        self.shed = 0
+        self.waits = deque(maxlen=1000)  # recent queue wait times (seconds)
+
+    def snapshot(self, depth: int) -> dict:
+        waits = sorted(self.waits)
+
+        def pct(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 2) if waits else 0.0
+
+        return {
+            "queued": depth,
+            "submitted": self.submitted,
+            "shed": self.shed,
+            "wait_p50_ms": pct(0.50),
+            "wait_p99_ms": pct(0.99),
+            "wait_max_ms": round(waits[-1] * 1000, 2) if waits else 0.0,
+        }
+
+class RestScheduler:
+    def __init__(
+        self,
+        global_per_second: int = 50,
+        background_reserve: float = 0.25,
+        max_background_queue: int = 500,
+        max_background_wait: float = 30.0,
+    ):
+        self.global_per_second = global_per_second
+        # Background work only runs while at least this share of the global budget is left,
+        # and leaves one request in its bucket for user-visible calls.
+        self.background_global_need = 1 + global_per_second * background_reserve
+        self.max_background_queue = max_background_queue
+        self.max_background_wait = max_background_wait
+        self._sent: deque = deque()                # monotonic times of requests sent in the last second
+        self._global_blocked_until = 0.0           # set by a global 429
+        self._kinds: dict[str, str] = {}           # call kind (coroutine qualname) -> bucket hash
+        self._limits: dict[tuple, _Limit] = {}     # (major parameter, bucket hash) -> last known state
+        self.global_429s = 0
+        self.route_429s = 0
+        self._queues = {VISIBLE: deque(), BACKGROUND: deque()}
+        self._stats = {p: _ClassStats() for p in CLASS_NAMES}
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+
+    # --- Public API ---
+    async def critical(self, coro, route=None):
+        """Run now. Interaction responses and channel creation must never wait behind other work."""
+        stats = self._stats[CRITICAL]
+        stats.submitted += 1
+        stats.waits.append(0.0)
+        return await coro
+
+    async def visible(self, coro, route=None):
+        return await self._submit(coro, VISIBLE, route, droppable=False)
+
+    async def background(self, coro, route=None, droppable: bool = False):
+        return await self._submit(coro, BACKGROUND, route, droppable=droppable)
+
+    async def paced(self, aiterable, priority: int = BACKGROUND, route=None, page_size: int = 100):
+        """
+        Wrap a paginated iterator (e.g. channel.history) so each page of
+        page_size items is scheduled like one request.
+        """
+        count = 0
+        async for item in aiterable:
+            if count % page_size == 0:
+                await self._submit(_noop(), priority, route, droppable=False)
+            count += 1
+            yield item
+
+    def metrics(self) -> dict:
+        # Read-only: this is called from the keep-alive server's thread.
+        now = time.monotonic()
+        sent = sum(1 for t in list(self._sent) if t > now - 1.0)
+        blocked = max(0.0, self._global_blocked_until - now)
+        out = {CLASS_NAMES[p]: self._stats[p].snapshot(len(self._queues.get(p, ()))) for p in CLASS_NAMES}
+        out["global_budget"] = 0 if blocked else max(0, self.global_per_second - sent)
+        out["global_blocked_s"] = round(blocked, 2)
+        out["buckets_exhausted"] = sum(1 for lim in list(self._limits.values()) if lim.remaining == 0 and lim.reset_at > now)
+        out["global_429s"] = self.global_429s
+        out["route_429s"] = self.route_429s
+        return out
+
+    # --- Feeding the budget from Discord ---
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Pass as the bot's http_trace= so every request and rate-limit header reaches the scheduler."""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.observe_request()
+
+        async def on_request_end(session, context, params):
+            self.observe_response(params.url.path, params.response.status, params.response.headers)
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def observe_request(self, now: float | None = None):
+        """A request is going out (ours or one discord.py makes on its own)."""
+        item = _current_item.get()
+        if item is not None and item.precounted:
+            item.precounted = False  # already counted when the scheduler started it
+            return
+        now = time.monotonic() if now is None else now
+        self._sent.append(now)
+        self._prune_sent(now)
+
+    def observe_response(self, path: str, status: int, headers, now: float | None = None):
+        """Record the rate-limit headers of a response to the request made at path."""
+        now = time.monotonic() if now is None else now
+        retry_after = 0.0
+        if status == 429:
+            retry_after = float(headers.get("Retry-After") or 0)
+            if headers.get("X-RateLimit-Global") or headers.get("X-RateLimit-Scope") == "global":
+                self.global_429s += 1
+                self._global_blocked_until = max(self._global_blocked_until, now + retry_after)
+                self._wake()
+                return
+            self.route_429s += 1
+
+        bucket = headers.get("X-RateLimit-Bucket")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if bucket is None or remaining is None or reset_after is None:
+            return
+        item = _current_item.get()
+        if item is not None and item.kind:
+            self._kinds[item.kind] = bucket
+
+        match = _MAJOR_PARAMETER.search(path)
+        key = (match.group(1) if match else "", bucket)
+        limit = int(headers.get("X-RateLimit-Limit") or 1)
+        remaining = 0 if status == 429 else int(remaining)
+        reset_at = now + max(float(reset_after), retry_after)
+        state = self._limits.get(key)
+        if state is None:
+            if len(self._limits) > 2000:
+                self._prune_limits(now)
+            self._limits[key] = _Limit(limit, remaining, reset_at)
+        else:
+            state.limit, state.remaining, state.reset_at = limit, remaining, reset_at
+        self._wake()
+
+    # --- Internals ---
+    def _prune_sent(self, now: float):
+        sent = self._sent
+        while sent and sent[0] <= now - 1.0:
+            sent.popleft()
+
+    def _prune_limits(self, now: float):
+        # Buckets past their reset carry nothing we'd wait on.
+        for key in [k for k, lim in self._limits.items() if lim.reset_at <= now]:
+            del self._limits[key]
+
+    def _global_wait(self, need: float, now: float) -> float:
+        if now < self._global_blocked_until:
+            return self._global_blocked_until - now
+        self._prune_sent(now)
+        over = math.ceil(len(self._sent) + need - self.global_per_second)
+        if over <= 0:
+            return 0.0
+        # Wait until enough of the last second's requests have aged out
+        oldest = self._sent[min(over, len(self._sent)) - 1]
+        return max(0.0, oldest + 1.0 - now)
+
+    def _route_limit(self, item: _Item) -> _Limit | None:
+        if item.route is None or item.kind is None:
+            return None
+        bucket = self._kinds.get(item.kind)
+        if bucket is None:
+            return None
+        return self._limits.get((str(item.route), bucket))
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _submit(self, coro, priority: int, route, droppable: bool):
+        stats = self._stats[priority]
+        stats.submitted += 1
+        queue = self._queues[priority]
+        if droppable and len(queue) >= self.max_background_queue:
+            stats.shed += 1
+            coro.close()
+            return None
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        queue.append(_Item(coro, priority, route, droppable, future))
+        self._wakeup.set()
+        return await future
+
+    async def _dispatch(self):
+        while True:
+            wait = self._start_ready()
+            if wait == 0.0:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_ready(self) -> float | None:
+        """Start the first runnable item (visible before background). Returns 0 if one started,
+        otherwise how long until something could run (None = nothing queued)."""
+        now = time.monotonic()
+        soonest = None
+        for priority in (VISIBLE, BACKGROUND):
+            queue = self._queues[priority]
+            global_need = 1 if priority == VISIBLE else self.background_global_need
+            route_need = 1 if priority == VISIBLE else 2
+            for item in list(queue):
+                if item.future.cancelled():
+                    queue.remove(item)
+                    item.coro.close()
+                    continue
+                if item.droppable and now - item.enqueued > self.max_background_wait:
+                    queue.remove(item)
+                    self._stats[priority].shed += 1
+                    item.coro.close()
+                    item.future.set_result(None)
+                    continue
+                delay = self._global_wait(global_need, now)
+                limit = self._route_limit(item)
+                if limit is not None:
+                    delay = max(delay, limit.wait(route_need, now))
+                if delay == 0.0:
+                    queue.remove(item)
+                    self._start(item, limit, now)
+                    return 0.0
+                soonest = delay if soonest is None else min(soonest, delay)
+        return soonest
+
+    def _start(self, item: _Item, limit: _Limit | None, now: float):
+        # Count it now: its request only reaches the trace after this tick, and the dispatcher
+        # may start more items before then. (A paced page's request is made by the caller.)
+        if item.kind != _noop.__qualname__:
+            self._sent.append(now)
+            item.precounted = True
+        if limit is not None:
+            limit.take(now)
+        self._stats[item.priority].waits.append(now - item.enqueued)
+        asyncio.create_task(self._run(item))
+
+    async def _run(self, item: _Item):
+        _current_item.set(item)  # this task only
+        try:
+            result = await item.coro
+        except asyncio.CancelledError:
+            item.future.cancel()
+            raise
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if not item.future.done():
+            item.future.set_result(result)
+
+async def _noop():
+    return None
@@ -0,0 +1,168 @@
+"""
+Spam / raid detection - spamguard.py
+
+SpamDetector.observe() is called for every guild message and answers, in a
+few microseconds and without any I/O, whether someone just crossed a
+threshold. It keeps sliding windows per active user and per channel:
+
+- message rate       N messages within W seconds
+- duplicate content  the same text (case/whitespace-insensitive) K times within W seconds
+- mentions           M user/role mentions summed within W seconds
+- channel rate       messages per channel across all users (raid signal)
+
+Every window is a bounded deque, so memory per active user is constant.
+Users idle for longer than the longest window are dropped, and the table
+is capped at max_users.
+
+The detector only decides; main.py acts on the verdicts (timeout, bulk
+delete, one summary in the log channel).
+"""
+
+import time
+from collections import deque, OrderedDict
+
+class _UserState:
+    __slots__ = ("times", "hashes", "mentions", "recent", "last_seen", "tripped_at")
+
+    def __init__(self, rate_count: int, dup_count: int, recent: int):
+        self.times = deque(maxlen=rate_count)   # message timestamps
+        self.hashes = deque(maxlen=dup_count)   # (timestamp, content hash)
+        self.mentions = deque(maxlen=16)        # (timestamp, mention count), only messages with mentions
+        self.recent = deque(maxlen=recent)      # (timestamp, channel id, message id) for cleanup
+        self.last_seen = 0.0
+        self.tripped_at = None
+
+class SpamDetector:
+    def __init__(
+        self,
+        rate_count: int = 6,          # 6 messages ...
+        rate_window: float = 5.0,     # ... in 5 seconds
+        dup_count: int = 4,           # same message 4 times ...
+        dup_window: float = 30.0,     # ... in 30 seconds
+        mention_limit: int = 8,       # 8 mentions ...
+        mention_window: float = 10.0, # ... in 10 seconds
+        channel_count: int = 40,      # 40 messages in one channel ...
+        channel_window: float = 5.0,  # ... in 5 seconds from everyone together
+        cooldown: float = 60.0,       # don't act on the same user/channel twice within this
+        recent_messages: int = 50,    # how many of a user's message ids to remember for bulk delete
+        max_users: int = 10000,
+    ):
+        self.rate_count, self.rate_window = rate_count, rate_window
+        self.dup_count, self.dup_window = dup_count, dup_window
+        self.mention_limit, self.mention_window = mention_limit, mention_window
+        self.channel_count, self.channel_window = channel_count, channel_window
+        self.cooldown = cooldown
+        self.recent_messages = recent_messages
+        self.max_users = max_users
+        self.idle_ttl = max(rate_window, dup_window, mention_window, cooldown)
+        self._users: OrderedDict[int, _UserState] = OrderedDict()  # least recently active first
+        self._channels: dict[int, deque] = {}
+        self._channel_tripped: dict[int, float] = {}
+        self.observed = 0
+        self.user_trips = 0
+        self.raid_trips = 0
+
+    def observe(self, user_id: int, channel_id: int, message_id: int, content: str, mention_count: int = 0, now: float | None = None) -> list[dict]:
+        """
+        Record one message. Returns the verdicts it triggered (usually none; one
+        message can trip both a user and a raid threshold):
+            {"kind": "user", "user_id", "reason", "messages": [(channel_id, message_id), ...]}
+            {"kind": "raid", "channel_id", "reason", "count", "users"}
+        """
+        if now is None:
+            now = time.monotonic()
+        self.observed += 1
+        self._evict(now)
+
+        verdict = self._observe_user(user_id, channel_id, message_id, content, mention_count, now)
+        raid = self._observe_channel(user_id, channel_id, now)
+        return [v for v in (verdict, raid) if v is not None]
+
+    # --- Per user ---
+    def _observe_user(self, user_id, channel_id, message_id, content, mention_count, now):
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(self.rate_count, self.dup_count, self.recent_messages)
+        else:
+            self._users.move_to_end(user_id)
+        state.last_seen = now
+        state.times.append(now)
+        state.recent.append((now, channel_id, message_id))
+
+        if state.tripped_at is not None and now - state.tripped_at < self.cooldown:
+            return None  # already acted on; the timeout should stop them
+
+        reason = None
+        # Rate: the deque holds the last rate_count timestamps
+        if len(state.times) == self.rate_count and now - state.times[0] <= self.rate_window:
+            reason = f"{self.rate_count} messages in {now - state.times[0]:.1f}s"
+
+        # Duplicates
+        text = " ".join(content.lower().split()) if content else ""
+        if text:
+            h = hash(text)
+            state.hashes.append((now, h))
+            dupes = sum(1 for ts, other in state.hashes if other == h and now - ts <= self.dup_window)
+            if reason is None and dupes >= self.dup_count:
+                reason = f"same message {dupes} times in {self.dup_window:.0f}s"
+
+        # Mentions
+        if mention_count:
+            state.mentions.append((now, mention_count))
+            total = sum(n for ts, n in state.mentions if now - ts <= self.mention_window)
+            if reason is None and total >= self.mention_limit:
+                reason = f"{total} mentions in {self.mention_window:.0f}s"
+
+        if reason is None:
+            return None
+        state.tripped_at = now
+        self.user_trips += 1
+        # Everything they sent inside the longest window is up for deletion
+        horizon = now - max(self.rate_window, self.dup_window, self.mention_window)
+        messages = [(cid, mid) for ts, cid, mid in state.recent if ts >= horizon]
+        return {"kind": "user", "user_id": user_id, "reason": reason, "messages": messages}
+
+    # --- Per channel ---
+    def _observe_channel(self, user_id, channel_id, now):
+        window = self._channels.get(channel_id)
+        if window is None:
+            window = self._channels[channel_id] = deque(maxlen=self.channel_count)
+        window.append((now, user_id))
+        if len(window) < self.channel_count or now - window[0][0] > self.channel_window:
+            return None
+        last = self._channel_tripped.get(channel_id)
+        if last is not None and now - last < self.cooldown:
+            return None
+        self._channel_tripped[channel_id] = now
+        self.raid_trips += 1
+        users = len({uid for _, uid in window})
+        return {
+            "kind": "raid",
+            "channel_id": channel_id,
+            "reason": f"{len(window)} messages from {users} users in {now - window[0][0]:.1f}s",
+            "count": len(window),
+            "users": users,
+        }
+
+    # --- Housekeeping ---
+    def _evict(self, now: float):
+        # Users are kept in activity order, so idle ones are at the front
+        users = self._users
+        while users:
+            user_id, state = next(iter(users.items()))
+            if now - state.last_seen <= self.idle_ttl and len(users) < self.max_users:
+                break
+            users.popitem(last=False)
+        if len(self._channels) > 1000:
+            for channel_id in [c for c, w in self._channels.items() if now - w[-1][0] > self.channel_window]:
+                del self._channels[channel_id]
+            for channel_id in [c for c, ts in self._channel_tripped.items() if now - ts > self.cooldown]:
+                del self._channel_tripped[channel_id]
+
+    def stats(self) -> dict:
+        return {
+            "observed": self.observed,
+            "active_users": len(self._users),
+            "user_trips": self.user_trips,
+            "raid_trips": self.raid_trips,
+        }
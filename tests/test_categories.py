@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import unittest
+
+from categories import CategoryAllocator
+
+_ids = itertools.count(1000)
+
+class FakeCategory:
+    def __init__(self, guild, name, position):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.position = position
+        self.overwrites = {"@everyone": "deny"}
+        self.channels = []
+        self.deleted = False
+
+    async def delete(self, reason=None):
+        self.deleted = True
+        self.guild.categories.remove(self)
+
+class FakeChannel:
+    def __init__(self):
+        self.id = next(_ids)
+
+class FakeGuild:
+    def __init__(self):
+        self.categories = []
+        self.created = []
+
+    def add_category(self, name, channels=0):
+        cat = FakeCategory(self, name, len(self.categories))
+        cat.channels = [FakeChannel() for _ in range(channels)]
+        self.categories.append(cat)
+        return cat
+
+    def get_channel(self, channel_id):
+        return next((c for c in self.categories if c.id == channel_id), None)
+
+    async def create_category(self, name, overwrites, position, reason=None):
+        cat = self.add_category(name)
+        cat.overwrites = overwrites
+        self.created.append(name)
+        return cat
+
+class CategoryAllocatorTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.guild = FakeGuild()
+        self.base = self.guild.add_category("Desk Support")
+        self.allocator = CategoryAllocator([self.base.id], limit=3)
+
+    async def open_ticket(self):
+        cat = await self.allocator.reserve(self.base)
+        channel = FakeChannel()
+        self.allocator.confirm(cat, channel)
+        return cat, channel
+
+    async def test_uses_base_category_until_full(self):
+        for _ in range(3):
+            cat, _ = await self.open_ticket()
+            self.assertIs(cat, self.base)
+        self.assertEqual(self.guild.created, [])
+
+    async def test_creates_numbered_overflow_categories(self):
+        self.base.channels = [FakeChannel() for _ in range(3)]
+        cat, _ = await self.open_ticket()
+        self.assertEqual(cat.name, "Desk Support 2")
+        self.assertEqual(cat.overwrites, self.base.overwrites)
+        for _ in range(2):
+            self.assertIs((await self.open_ticket())[0], cat)  # created-but-uncached channels count too
+        cat3, _ = await self.open_ticket()
+        self.assertEqual(cat3.name, "Desk Support 3")
+        self.assertEqual(self.guild.created, ["Desk Support 2", "Desk Support 3"])
+
+    async def test_numbering_continues_after_gaps(self):
+        self.base.channels = [FakeChannel() for _ in range(3)]
+        self.guild.add_category("Desk Support 4", channels=3)
+        cat, _ = await self.open_ticket()
+        self.assertEqual(cat.name, "Desk Support 5")
+
+    async def test_concurrent_reservations_share_one_new_overflow(self):
+        self.base.channels = [FakeChannel() for _ in range(3)]
+        cats = await asyncio.gather(*(self.allocator.reserve(self.base) for _ in range(3)))
+        self.assertEqual({c.name for c in cats}, {"Desk Support 2"})
+        self.assertEqual(self.guild.created, ["Desk Support 2"])
+
+    async def test_cancel_frees_the_slot(self):
+        self.base.channels = [FakeChannel() for _ in range(2)]
+        cat = await self.allocator.reserve(self.base)
+        self.allocator.cancel(cat)
+        self.assertEqual(self.allocator.count(self.base), 2)
+
+    async def test_empty_overflow_category_is_deleted(self):
+        overflow = self.guild.add_category("Desk Support 2")  # its last channel is already gone from the cache
+        await self.allocator.release(overflow, FakeChannel().id)
+        self.assertTrue(overflow.deleted)
+        self.assertEqual(self.allocator.family(self.base), [self.base])
+
+    async def test_overflow_with_tickets_left_is_kept(self):
+        overflow = self.guild.add_category("Desk Support 2", channels=2)
+        leaving = overflow.channels[0]
+        await self.allocator.release(overflow, leaving.id)
+        self.assertFalse(overflow.deleted)
+
+    async def test_base_category_is_never_deleted(self):
+        await self.allocator.release(self.base, 1)
+        self.assertFalse(self.base.deleted)
+
+    async def test_category_being_deleted_is_not_allocated_into(self):
+        self.base.channels = [FakeChannel() for _ in range(3)]
+        overflow = self.guild.add_category("Desk Support 2")
+        delete_started = asyncio.Event()
+        finish_delete = asyncio.Event()
+
+        async def slow_delete(reason=None):
+            delete_started.set()
+            await finish_delete.wait()
+            self.guild.categories.remove(overflow)
+
+        overflow.delete = slow_delete
+        release = asyncio.create_task(self.allocator.release(overflow, 1))
+        await delete_started.wait()
+
+        # The family lock is free while the delete is in flight; the new ticket gets a new category
+        cat = await asyncio.wait_for(self.allocator.reserve(self.base), timeout=1)
+        self.assertIsNot(cat, overflow)
+        self.assertEqual(cat.name, "Desk Support 3")
+        self.assertNotIn(overflow, self.allocator.family(self.base))
+        finish_delete.set()
+        await release
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import unittest
+
+from jobs import JobQueue
+
+async def wait_until(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.005)
+
+class JobQueueTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "jobs_state.json")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def saved(self) -> list:
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_state(self, jobs: list):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(jobs, f)
+
+    def stored_job(self, **fields) -> dict:
+        job = {
+            "id": "job-1", "kind": "work", "key": "work:1", "payload": {}, "state": "queued",
+            "done": [], "data": {}, "status": {}, "error": None, "created_at": time.time(), "failed_at": None,
+        }
+        job.update(fields)
+        return job
+
+    async def asyncTearDown(self):
+        await self.queue.stop()
+
+    def make_queue(self, **kwargs) -> JobQueue:
+        self.queue = JobQueue(self.path, **kwargs)
+        return self.queue
+
+    async def test_same_key_is_deduplicated_while_active(self):
+        queue = self.make_queue()
+        release = asyncio.Event()
+        runs = []
+
+        @queue.handler("work")
+        async def work(job, q):
+            runs.append(job["payload"])
+            await release.wait()
+
+        await queue.start()
+        first, created = queue.submit("work", "work:1", {"n": 1})
+        self.assertTrue(created)
+        second, created = queue.submit("work", "work:1", {"n": 2})
+        self.assertFalse(created)
+        self.assertIs(second, first)
+
+        release.set()
+        await wait_until(lambda: queue.active("work:1") is None)
+        self.assertEqual(runs, [{"n": 1}])
+        self.assertEqual(self.saved(), [])
+
+    async def test_resume_failed_continues_from_checkpoint(self):
+        queue = self.make_queue()
+        seen = []
+
+        @queue.handler("work")
+        async def work(job, q):
+            seen.append((list(job["done"]), job["payload"]))
+            if not q.done(job, "first"):
+                q.checkpoint(job, "first", value=1)
+            if len(seen) == 1:
+                raise RuntimeError("boom")
+
+        await queue.start()
+        job, _ = queue.submit("work", "work:1", {"by": "a"})
+        await wait_until(lambda: job["state"] == "failed")
+        self.assertEqual(job["error"], "boom")
+
+        again, created = queue.submit("work", "work:1", {"by": "b"}, resume_failed=True)
+        self.assertTrue(created)
+        self.assertEqual(again["id"], job["id"])
+        await wait_until(lambda: queue.active("work:1") is None)
+        self.assertEqual(seen, [([], {"by": "a"}), (["first"], {"by": "b"})])
+
+    async def test_failed_job_is_replaced_without_resume_failed(self):
+        queue = self.make_queue()
+        runs = []
+
+        @queue.handler("work")
+        async def work(job, q):
+            runs.append(job["payload"]["n"])
+            q.checkpoint(job, "collect")
+            if job["payload"]["n"] == 50:
+                raise RuntimeError("boom")
+
+        await queue.start()
+        failed, _ = queue.submit("work", "work:1", {"n": 50})
+        await wait_until(lambda: failed["state"] == "failed")
+
+        fresh, created = queue.submit("work", "work:1", {"n": 5})
+        self.assertTrue(created)
+        self.assertNotEqual(fresh["id"], failed["id"])
+        await wait_until(lambda: queue.active("work:1") is None)
+        self.assertEqual(runs, [50, 5])
+        self.assertEqual(self.saved(), [])
+
+    async def test_start_resumes_jobs_interrupted_by_a_restart(self):
+        self.write_state([self.stored_job(state="running", done=["first"], data={"value": 1})])
+        queue = self.make_queue()
+        seen = []
+
+        @queue.handler("work")
+        async def work(job, q):
+            seen.append((list(job["done"]), dict(job["data"])))
+
+        await queue.start()
+        await wait_until(lambda: queue.active("work:1") is None)
+        self.assertEqual(seen, [(["first"], {"value": 1})])
+        self.assertEqual(self.saved(), [])
+
+    async def test_constructing_a_queue_does_not_touch_the_state_file(self):
+        self.write_state([self.stored_job(state="failed", failed_at=0.0)])
+        before = os.path.getmtime(self.path)
+        self.make_queue()
+        self.assertEqual(os.path.getmtime(self.path), before)
+        self.assertEqual(len(self.saved()), 1)
+
+    async def test_failed_jobs_expire_after_ttl(self):
+        self.write_state([
+            self.stored_job(id="old", key="work:old", state="failed", failed_at=time.time() - 7200),
+            self.stored_job(id="new", key="work:new", state="failed", failed_at=time.time()),
+        ])
+        queue = self.make_queue(failed_ttl=3600)
+
+        @queue.handler("work")
+        async def work(job, q):
+            pass
+
+        await queue.start()
+        self.assertIsNone(queue.active("work:old"))
+        self.assertEqual([j["id"] for j in self.saved()], ["new"])
+
+    async def test_cancelled_await_fails_the_job_and_keeps_the_worker(self):
+        queue = self.make_queue(concurrency=1)
+
+        @queue.handler("work")
+        async def work(job, q):
+            if job["payload"]["cancel"]:
+                future = asyncio.get_running_loop().create_future()
+                future.cancel()
+                await future
+
+        await queue.start()
+        cancelled, _ = queue.submit("work", "work:1", {"cancel": True})
+        await wait_until(lambda: cancelled["state"] == "failed")
+        self.assertEqual(cancelled["error"], "cancelled")
+
+        queue.submit("work", "work:2", {"cancel": False})
+        await wait_until(lambda: queue.active("work:2") is None)
+
+    async def test_stop_leaves_running_job_to_resume(self):
+        queue = self.make_queue()
+        started = asyncio.Event()
+
+        @queue.handler("work")
+        async def work(job, q):
+            started.set()
+            await asyncio.sleep(10)
+
+        await queue.start()
+        queue.submit("work", "work:1", {})
+        await started.wait()
+        await queue.stop()
+        self.assertEqual([j["state"] for j in self.saved()], ["running"])
+
+if __name__ == "__main__":
+    unittest.main()
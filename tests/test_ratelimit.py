@@ -0,0 +1,179 @@
+import time
+import asyncio
+import unittest
+
+from aiohttp import web, ClientSession
+
+from ratelimit import RestScheduler
+
+class Recorder:
+    """Coroutine factory that records the order calls actually ran in."""
+
+    def __init__(self):
+        self.ran = []
+
+    async def call(self, name, result=None):
+        self.ran.append(name)
+        return result
+
+def headers(bucket="b1", limit=5, remaining=4, reset_after=1.0):
+    return {
+        "X-RateLimit-Bucket": bucket,
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset-After": str(reset_after),
+    }
+
+class RestSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_critical_runs_immediately(self):
+        rest = RestScheduler()
+        rec = Recorder()
+        self.assertEqual(await rest.critical(rec.call("reply", 42)), 42)
+        self.assertEqual(rest.metrics()["critical"]["submitted"], 1)
+
+    async def test_visible_runs_before_background(self):
+        rest = RestScheduler(global_per_second=50)
+        rec = Recorder()
+        # Leave less than the background reserve so only visible work may start
+        now = time.monotonic()
+        for _ in range(45):
+            rest.observe_request(now=now)
+        background = asyncio.ensure_future(rest.background(rec.call("log")))
+        visible = asyncio.ensure_future(rest.visible(rec.call("confirm")))
+        await visible
+        self.assertEqual(rec.ran, ["confirm"])
+        await asyncio.wait_for(background, timeout=3)
+        self.assertEqual(rec.ran, ["confirm", "log"])
+
+    async def test_idle_calls_on_one_route_are_not_throttled(self):
+        rest = RestScheduler()
+        rec = Recorder()
+        started = time.monotonic()
+        await asyncio.gather(
+            *(rest.background(rec.call(f"bg{i}"), route=1) for i in range(8)),
+            *(rest.visible(rec.call(f"vis{i}"), route=1) for i in range(3)),
+        )
+        self.assertEqual(len(rec.ran), 11)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    async def test_droppable_background_is_shed_when_queue_is_full(self):
+        rest = RestScheduler(max_background_queue=2)
+        rest.observe_response("/api/v10/channels/1", 429, {"X-RateLimit-Global": "true", "Retry-After": "5"})
+        rec = Recorder()
+        held = [asyncio.ensure_future(rest.background(rec.call(f"keep{i}"))) for i in range(2)]
+        await asyncio.sleep(0)
+        self.assertIsNone(await rest.background(rec.call("log"), droppable=True))
+        self.assertEqual(rest.metrics()["background"]["shed"], 1)
+        for future in held:
+            future.cancel()
+        await asyncio.gather(*held, return_exceptions=True)
+
+    async def test_droppable_background_is_shed_after_max_wait(self):
+        rest = RestScheduler(max_background_wait=0.05)
+        rest.observe_response("/api/v10/channels/1", 429, {"X-RateLimit-Global": "true", "Retry-After": "0.2"})
+        rec = Recorder()
+        self.assertIsNone(await rest.background(rec.call("log"), droppable=True))
+        self.assertEqual(rec.ran, [])
+
+    async def test_cancelled_caller_never_runs_its_call(self):
+        rest = RestScheduler()
+        rest.observe_response("/api/v10/channels/1", 429, {"X-RateLimit-Global": "true", "Retry-After": "0.1"})
+        rec = Recorder()
+        waiting = asyncio.ensure_future(rest.visible(rec.call("edit")))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        await rest.visible(rec.call("later"))
+        self.assertEqual(rec.ran, ["later"])
+        self.assertEqual(rest.metrics()["visible"]["queued"], 0)
+
+    async def test_exceptions_reach_the_caller(self):
+        rest = RestScheduler()
+
+        async def fail():
+            raise ValueError("nope")
+
+        with self.assertRaises(ValueError):
+            await rest.visible(fail())
+
+    async def test_global_429_holds_queued_work(self):
+        rest = RestScheduler()
+        rest.observe_response("/api/v10/channels/1", 429, {"X-RateLimit-Global": "true", "Retry-After": "0.2"})
+        rec = Recorder()
+        started = time.monotonic()
+        await rest.visible(rec.call("edit"))
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertEqual(rest.metrics()["global_429s"], 1)
+
+    async def test_exhausted_bucket_delays_only_its_kind_of_call(self):
+        rest = RestScheduler()
+
+        async def edit_topic():
+            rest.observe_response("/api/v10/channels/7", 200, headers(bucket="patch", limit=2, remaining=0, reset_after=0.3))
+
+        async def send():
+            rest.observe_response("/api/v10/channels/7/messages", 200, headers(bucket="post", remaining=4))
+
+        await rest.visible(edit_topic(), route=7)  # learns edit_topic -> "patch", now exhausted on channel 7
+
+        started = time.monotonic()
+        await rest.visible(send(), route=7)
+        await rest.visible(edit_topic(), route=8)
+        self.assertLess(time.monotonic() - started, 0.1)
+
+        await rest.visible(edit_topic(), route=7)
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+        self.assertEqual(rest.metrics()["buckets_exhausted"], 1)
+
+    async def test_background_leaves_last_request_in_bucket_for_visible(self):
+        rest = RestScheduler()
+        rec = Recorder()
+
+        async def send(name):
+            rec.ran.append(name)
+            rest.observe_response("/api/v10/channels/7/messages", 200, headers(bucket="post", limit=5, remaining=1, reset_after=0.3))
+
+        await rest.visible(send("first"), route=7)
+        background = asyncio.ensure_future(rest.background(send("log"), route=7))
+        await asyncio.sleep(0.05)
+        self.assertEqual(rec.ran, ["first"])
+        await rest.visible(send("confirm"), route=7)
+        self.assertEqual(rec.ran, ["first", "confirm"])
+        await asyncio.wait_for(background, timeout=2)
+        self.assertEqual(rec.ran, ["first", "confirm", "log"])
+
+    async def test_trace_feeds_headers_from_real_responses(self):
+        remaining = [2]
+
+        async def patch_channel(request):
+            remaining[0] = max(0, remaining[0] - 1)
+            return web.json_response({}, headers=headers(bucket="patch", limit=2, remaining=remaining[0], reset_after=0.3))
+
+        app = web.Application()
+        app.router.add_patch("/api/v10/channels/{channel_id}", patch_channel)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        self.addAsyncCleanup(runner.cleanup)
+
+        rest = RestScheduler()
+        async with ClientSession(trace_configs=[rest.trace_config()]) as session:
+            async def edit_topic():
+                async with session.patch(f"http://127.0.0.1:{port}/api/v10/channels/7") as response:
+                    await response.read()
+
+            started = time.monotonic()
+            await rest.visible(edit_topic(), route=7)
+            await rest.visible(edit_topic(), route=7)  # Discord now says 0 remaining
+            self.assertLess(time.monotonic() - started, 0.2)
+            await rest.visible(edit_topic(), route=7)
+            self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+        # Every request went through the trace and was counted once
+        self.assertEqual(50 - rest.metrics()["global_budget"], 3)
+
+if __name__ == "__main__":
+    unittest.main()
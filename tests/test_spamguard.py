@@ -0,0 +1,87 @@
+import unittest
+
+from spamguard import SpamDetector
+
+def kinds(verdicts: list) -> list:
+    return [v["kind"] for v in verdicts]
+
+class SpamDetectorTest(unittest.TestCase):
+    def detector(self, **kwargs) -> SpamDetector:
+        # Raid threshold out of the way unless a test sets it
+        kwargs.setdefault("channel_count", 1000)
+        return SpamDetector(**kwargs)
+
+    def test_normal_chatter_is_left_alone(self):
+        d = self.detector()
+        for i in range(20):
+            self.assertEqual(d.observe(1, 10, i, f"message {i}", now=i * 2.0), [])
+        self.assertEqual(d.stats()["user_trips"], 0)
+
+    def test_message_rate(self):
+        d = self.detector(rate_count=4, rate_window=5.0)
+        for i in range(3):
+            self.assertEqual(d.observe(1, 10, i, f"m{i}", now=i * 1.0), [])
+        verdicts = d.observe(1, 10, 3, "m3", now=3.0)
+        self.assertEqual(kinds(verdicts), ["user"])
+        self.assertIn("4 messages", verdicts[0]["reason"])
+        self.assertEqual(verdicts[0]["messages"], [(10, 0), (10, 1), (10, 2), (10, 3)])
+
+    def test_rate_outside_window_does_not_trip(self):
+        d = self.detector(rate_count=4, rate_window=5.0)
+        for i in range(8):
+            self.assertEqual(d.observe(1, 10, i, f"m{i}", now=i * 2.0), [])
+
+    def test_duplicate_content_is_case_and_whitespace_insensitive(self):
+        d = self.detector(rate_count=100, dup_count=3, dup_window=30.0)
+        self.assertEqual(d.observe(1, 10, 1, "Buy  NOW", now=0.0), [])
+        self.assertEqual(d.observe(1, 11, 2, "buy now", now=5.0), [])
+        verdicts = d.observe(1, 12, 3, " BUY now ", now=10.0)
+        self.assertEqual(kinds(verdicts), ["user"])
+        self.assertIn("same message 3 times", verdicts[0]["reason"])
+        self.assertEqual({cid for cid, _ in verdicts[0]["messages"]}, {10, 11, 12})
+
+    def test_mentions_are_summed_over_window(self):
+        d = self.detector(rate_count=100, mention_limit=8, mention_window=10.0)
+        self.assertEqual(d.observe(1, 10, 1, "hey @a @b @c", mention_count=3, now=0.0), [])
+        self.assertEqual(d.observe(1, 10, 2, "hey again", mention_count=3, now=4.0), [])
+        verdicts = d.observe(1, 10, 3, "and again", mention_count=2, now=8.0)
+        self.assertEqual(kinds(verdicts), ["user"])
+        self.assertIn("8 mentions", verdicts[0]["reason"])
+
+    def test_user_is_not_flagged_twice_within_cooldown(self):
+        d = self.detector(rate_count=3, rate_window=5.0, cooldown=60.0)
+        verdicts = [d.observe(1, 10, i, f"m{i}", now=i * 0.5) for i in range(6)]
+        self.assertEqual(sum(len(v) for v in verdicts), 1)
+        self.assertEqual(kinds(d.observe(1, 10, 99, "x", now=100.0) + d.observe(1, 10, 100, "y", now=100.1)
+                               + d.observe(1, 10, 101, "z", now=100.2)), ["user"])
+
+    def test_channel_rate_flags_a_raid(self):
+        d = self.detector(channel_count=5, channel_window=5.0)
+        for user in range(4):
+            self.assertEqual(d.observe(user, 10, user, "hi", now=user * 0.5), [])
+        verdicts = d.observe(4, 10, 4, "hi", now=2.0)
+        self.assertEqual(kinds(verdicts), ["raid"])
+        self.assertEqual(verdicts[0]["channel_id"], 10)
+        self.assertEqual(verdicts[0]["users"], 5)
+        # Cooldown: the channel isn't reported again right away
+        self.assertEqual(d.observe(5, 10, 5, "hi", now=2.5), [])
+
+    def test_message_tripping_user_and_raid_returns_both(self):
+        d = self.detector(rate_count=3, channel_count=3, channel_window=5.0)
+        d.observe(1, 10, 1, "a", now=0.0)
+        d.observe(1, 10, 2, "b", now=0.1)
+        verdicts = d.observe(1, 10, 3, "c", now=0.2)
+        self.assertEqual(kinds(verdicts), ["user", "raid"])
+        self.assertEqual(d.stats()["user_trips"], 1)
+        self.assertEqual(d.stats()["raid_trips"], 1)
+
+    def test_idle_users_are_evicted_and_table_is_capped(self):
+        d = self.detector(max_users=3)
+        for user in range(5):
+            d.observe(user, 10, user, "hi", now=0.0)
+        self.assertEqual(d.stats()["active_users"], 3)
+        d.observe(99, 10, 99, "hi", now=d.idle_ttl + 1.0)
+        self.assertEqual(d.stats()["active_users"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
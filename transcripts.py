@@ -0,0 +1,205 @@
+"""
+Transcript rendering - transcripts.py
+
+Turns raw message records into a transcript file (plaintext, JSONL or HTML).
+The formatting is CPU work that grows with the size of the ticket, so it runs
+in a process pool instead of on the bot's event loop. The loop only collects
+records (plain dicts, cheap to build and to pickle) and awaits the result.
+
+This module must stay importable without the bot's environment variables:
+pool workers import it on their own.
+"""
+
+import os
+import json
+import html
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+
+# Supported output formats -> file extension
+FORMATS = {
+    "txt": "txt",
+    "jsonl": "jsonl",
+    "html": "html",
+}
+
+# Records per pool task
+CHUNK_SIZE = 2000
+
+# --- Record collection (runs on the event loop, keep it cheap) ---
+def message_record(msg) -> dict:
+    """
+    Snapshot a discord.Message into a plain, picklable dict.
+    No string formatting happens here; that is left to the renderer.
+    """
+    author = msg.author
+    return {
+        "id": msg.id,
+        "ts": msg.created_at.replace(tzinfo=timezone.utc).timestamp(),
+        "author": str(author),
+        "author_id": getattr(author, "id", None),
+        "content": msg.content or "",
+        "attachments": [a.url for a in msg.attachments],
+    }
+
+def _format_ts(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+# --- Renderers (run inside pool workers) ---
+def render_plaintext(records: list[dict]) -> str:
+    # Same line format the bot has always used for purged_messages_*.txt
+    lines = []
+    for r in records:
+        author_id = r["author_id"] if r["author_id"] is not None else "unknown"
+        content = r["content"]
+        if r["attachments"]:
+            content += " [Attachments: " + ", ".join(r["attachments"]) + "]"
+        lines.append(f"{_format_ts(r['ts'])} | {r['author']} ({author_id}): {content}\n")
+    return "".join(lines)
+
+def render_jsonl(records: list[dict]) -> str:
+    lines = []
+    for r in records:
+        row = dict(r)
+        row["created_at"] = _format_ts(r["ts"])
+        lines.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return "".join(lines)
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ background: #1e2230; color: #dcddde; font-family: "Segoe UI", Helvetica, Arial, sans-serif; margin: 0; padding: 24px; }}
+h1 {{ color: #ffffff; font-size: 20px; border-bottom: 3px solid #313D61; padding-bottom: 8px; }}
+.meta {{ color: #8e9297; font-size: 13px; margin-bottom: 16px; }}
+.msg {{ padding: 6px 0; border-bottom: 1px solid #2b3040; }}
+.author {{ color: #ffffff; font-weight: 600; }}
+.id, .ts {{ color: #72767d; font-size: 12px; margin-left: 6px; }}
+.content {{ white-space: pre-wrap; word-wrap: break-word; margin-top: 2px; }}
+.attachments a {{ color: #00aff4; display: block; font-size: 13px; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<div class="meta">{count} messages</div>
+"""
+
+_HTML_TAIL = "</body>\n</html>\n"
+
+def _render_html_body(records: list[dict]) -> str:
+    esc = html.escape
+    parts = []
+    for r in records:
+        author_id = r["author_id"] if r["author_id"] is not None else "unknown"
+        parts.append(
+            '<div class="msg">'
+            f'<span class="author">{esc(r["author"])}</span>'
+            f'<span class="id">({author_id})</span>'
+            f'<span class="ts">{_format_ts(r["ts"])}</span>'
+            f'<div class="content">{esc(r["content"])}</div>'
+        )
+        if r["attachments"]:
+            links = "".join(f'<a href="{esc(u)}">{esc(u)}</a>' for u in r["attachments"])
+            parts.append(f'<div class="attachments">{links}</div>')
+        parts.append("</div>\n")
+    return "".join(parts)
+
+def _html_head(title: str, count: int) -> str:
+    return _HTML_HEAD.format(title=html.escape(title), count=count)
+
+def render_html(records: list[dict], title: str = "Transcript") -> str:
+    # Self-contained page: inline CSS, no scripts, no external assets.
+    return _html_head(title, len(records)) + _render_html_body(records) + _HTML_TAIL
+
+def render_chunk(records: list[dict], fmt: str) -> bytes:
+    """Render one slice of records. For HTML this is only the message body, without head/tail."""
+    if fmt == "txt":
+        text = render_plaintext(records)
+    elif fmt == "jsonl":
+        text = render_jsonl(records)
+    elif fmt == "html":
+        text = _render_html_body(records)
+    else:
+        raise ValueError(f"Unknown transcript format: {fmt!r}")
+    return text.encode("utf-8")
+
+def render_transcript(records: list[dict], fmt: str = "txt", title: str = "Transcript") -> bytes:
+    """Render records in the given format and return the encoded file body."""
+    body = render_chunk(records, fmt)
+    if fmt == "html":
+        return _html_head(title, len(records)).encode("utf-8") + body + _HTML_TAIL.encode("utf-8")
+    return body
+
+# --- Process pool front-end ---
+class TranscriptRenderer:
+    """
+    Owns the process pool used for rendering. Workers are started lazily on
+    the first render, so creating one at import time is free.
+
+    We use the "spawn" start method: the bot process runs extra threads
+    (Flask keep-alive, aiohttp), and forking a threaded process is unsafe.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def render(self, records: list[dict], fmt: str = "txt", title: str = "Transcript") -> bytes:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown transcript format: {fmt!r}")
+        # Ship records in slices: pickling one huge list holds the GIL long enough to stall the loop.
+        chunks = [records[i:i + CHUNK_SIZE] for i in range(0, len(records), CHUNK_SIZE)]
+        pool = self._get_pool()
+        try:
+            parts = await self._render_chunks(pool, chunks, fmt)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed) and the executor is unusable from now on.
+            # Replace it and retry once; if it breaks again only this render fails.
+            print("Transcript worker died; restarting the process pool")
+            self._discard_pool(pool)
+            pool = self._get_pool()
+            try:
+                parts = await self._render_chunks(pool, chunks, fmt)
+            except BrokenProcessPool:
+                self._discard_pool(pool)
+                raise
+        if fmt == "html":
+            parts = [_html_head(title, len(records)).encode("utf-8"), *parts, _HTML_TAIL.encode("utf-8")]
+        return b"".join(parts)
+
+    async def _render_chunks(self, pool: ProcessPoolExecutor, chunks: list[list[dict]], fmt: str) -> list[bytes]:
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(pool, render_chunk, chunk, fmt) for chunk in chunks))
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        # Concurrent renders all see the same breakage; only the first one replaces the pool,
+        # so a later one can't shut down the fresh pool another render is already retrying on.
+        if self._pool is pool:
+            self._pool = None
+            # Everything queued on a broken pool has already failed; nothing to cancel.
+            pool.shutdown(wait=False)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+def transcript_filename(prefix: str, channel_id: int, fmt: str = "txt") -> str:
+    return f"{prefix}_{channel_id}.{FORMATS.get(fmt, 'txt')}"
+
+def default_workers() -> int:
+    # One worker is enough for a handful of concurrent closes; leave the rest of the CPU to the bot.
+    return max(1, min(2, (os.cpu_count() or 1) - 1))